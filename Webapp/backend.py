@@ -1,20 +1,114 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
+import asyncpg
+import orjson
+import redis.asyncio as redis
 import os
+import asyncio
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+import hashlib
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import List
-from fastapi import Request
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import Request, Query
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi import status
-import requests
-import random
+import httpx
+import time
+import logging
+from collections import deque
 
 # Explicitly load .env from the Webapp directory
 load_dotenv(dotenv_path=Path(__file__).parent / ".env")
 
-app = FastAPI()
+def get_env(key, default=None):
+    val = os.getenv(key, default)
+    if val is None:
+        raise ValueError(f"Missing required environment variable: {key}")
+    return val.replace("'", "")
+
+@dataclass(frozen=True, slots=True)
+class PgConfig:
+    host: str
+    database: str
+    user: str
+    password: str
+    port: int
+    ssl: str
+    min_size: int
+    max_size: int
+    max_inactive_connection_lifetime: float
+    statement_cache_size: int
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=get_env('PG_HOST'),
+            database=get_env('PG_DATABASE'),
+            user=get_env('PG_USER'),
+            password=get_env('PG_PASSWORD'),
+            port=int(os.getenv('PG_PORT', 5432)),
+            ssl=os.getenv('PG_SSLMODE', 'require'),
+            min_size=int(os.getenv('PG_POOL_MIN', 5)),
+            max_size=int(os.getenv('PG_POOL_MAX', 20)),
+            # Recycle idle sockets before the server/pooler drops them, instead of pinging on every acquire
+            max_inactive_connection_lifetime=float(os.getenv('PG_POOL_IDLE_LIFETIME', 300)),
+            # asyncpg prepares each distinct query text once per connection and reuses the plan;
+            # set to 0 only when going through a transaction-mode pooler without prepared statement support
+            statement_cache_size=int(os.getenv('PG_STATEMENT_CACHE_SIZE', 100)),
+        )
+
+# Read once at import; the pool factory only unpacks it
+PG_CONFIG = PgConfig.from_env()
+
+# asyncpg does not implement SCRAM-SHA-256-PLUS, so channel binding cannot be enforced as psycopg2 did
+if os.getenv('PG_CHANNELBINDING', '').replace("'", "") == 'require':
+    logging.getLogger(__name__).warning(
+        "PG_CHANNELBINDING=require is not supported by asyncpg; connecting with TLS (PG_SSLMODE=%s) "
+        "but without SCRAM channel binding", PG_CONFIG.ssl
+    )
+
+async def create_db_pool():
+    # asyncpg has no channel_binding option and never uses channel binding (see the warning above)
+    return await asyncpg.create_pool(**asdict(PG_CONFIG), command_timeout=60)
+
+# Indexed by migrate_indexes.py
+DROPDOWN_COLUMNS = (
+    ("products", "Product"),
+    ("sub_products", "Sub-product"),
+    ("issues", "Issue"),
+    ("sub_issues", "Sub-issue"),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pool for the lifetime of the app instead of a new connection per request
+    app.state.pg_pool = await create_db_pool()
+    # Response cache is optional; without REDIS_URL every request goes to the database
+    redis_url = os.getenv('REDIS_URL')
+    app.state.redis = redis.from_url(redis_url) if redis_url else None
+    # Shared keep-alive client for the n8n webhook proxy
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=30.0,
+        limits=httpx.Limits(
+            max_keepalive_connections=int(os.getenv('HTTP_MAX_KEEPALIVE', 50)),
+            max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', 100)),
+            # Keep idle sockets to n8n open a full minute so bursts reuse the TLS session
+            keepalive_expiry=60.0,
+        ),
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        if app.state.redis is not None:
+            await app.state.redis.aclose()
+        await app.state.pg_pool.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,73 +118,143 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_db_connection():
-    def get_env(key, default=None):
-        val = os.getenv(key, default)
-        if val is None:
-            raise ValueError(f"Missing required environment variable: {key}")
-        return val.replace("'", "")
-    return psycopg2.connect(
-        host=get_env('PG_HOST'),
-        database=get_env('PG_DATABASE'),
-        user=get_env('PG_USER'),
-        password=get_env('PG_PASSWORD'),
-        port=int(os.getenv('PG_PORT', 5432)),
-        sslmode=os.getenv('PG_SSLMODE', 'require'),
-        channel_binding=os.getenv('PG_CHANNELBINDING', 'require')
+OPTIONS_CACHE_KEY = "options:v1"
+OPTIONS_CACHE_TTL = 300
+COMPLAINTS_CACHE_KEY = "complaints:v1"
+COMPLAINTS_ETAG_KEY = "complaints:etag"
+COMPLAINTS_CACHE_TTL = 60
+# API field name -> DB column, in the order returned by default
+COMPLAINT_COLUMNS = {
+    "id": "Complaint ID",
+    "product": "Product",
+    "sub_product": "Sub-product",
+    "issue": "Issue",
+    "sub_issue": "Sub-issue",
+    "complaint": "Consumer complaint narrative",
+}
+COMPLAINT_FIELDS = tuple(COMPLAINT_COLUMNS)
+# Page size for ?after_id= requests that don't pass a limit
+COMPLAINTS_DEFAULT_PAGE_SIZE = 100
+
+@lru_cache(maxsize=64)
+def complaint_queries(fields):
+    """(full, first page, next page) SELECTs for a field projection, built once per projection
+    so every request sends the exact same text and hits the per-connection statement cache"""
+    select = "SELECT " + ", ".join(f'"{COMPLAINT_COLUMNS[f]}"' for f in fields) + " FROM public.test"
+    return (
+        select,
+        select + ' ORDER BY "Complaint ID" LIMIT $1',
+        select + ' WHERE "Complaint ID" > $1 ORDER BY "Complaint ID" LIMIT $2',
     )
 
+COMPLAINTS_SQL = complaint_queries(COMPLAINT_FIELDS)[0]
+# Dropdown key -> single-column DISTINCT query; NULL and empty values are skipped
+OPTIONS_SQL = {
+    key: f'SELECT DISTINCT "{column}" FROM public.test WHERE "{column}" <> \'\' ORDER BY 1'
+    for key, column in DROPDOWN_COLUMNS
+}
+
+# Draws candidate IDs server-side and keeps the first one not already taken (checked via the unique index);
+# ON CONFLICT covers a concurrent insert claiming the same ID
+INSERT_COMPLAINT_SQL = '''
+    INSERT INTO public.test ("Complaint ID", "Product", "Sub-product", "Issue", "Sub-issue", "Consumer complaint narrative", "AI_Response", "AI_IssueGroup", "Priority")
+    SELECT s.candidate, $1, $2, $3, $4, $5, $6, $7, $8
+    FROM (SELECT floor(random() * 9000000 + 1000000)::bigint AS candidate FROM generate_series(1, 20)) s
+    WHERE NOT EXISTS (SELECT 1 FROM public.test t WHERE t."Complaint ID" = s.candidate)
+    LIMIT 1
+    ON CONFLICT DO NOTHING
+    RETURNING "Complaint ID"
+'''
+
+def acquire():
+    return app.state.pg_pool.acquire()
+
+async def invalidate_cache():
+    if app.state.redis is not None:
+        await app.state.redis.delete(OPTIONS_CACHE_KEY, COMPLAINTS_CACHE_KEY, COMPLAINTS_ETAG_KEY)
+
+def complaint_to_dict(row):
+    return dict(zip(COMPLAINT_FIELDS, row))
+
 @app.get("/api/complaints")
-def get_complaints():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT "Complaint ID", "Product", "Sub-product", "Issue", "Sub-issue", "Consumer complaint narrative"
-        FROM public.test
-    ''')
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    complaints = [
-        {
-            "id": row[0],
-            "product": row[1],
-            "sub_product": row[2],
-            "issue": row[3],
-            "sub_issue": row[4],
-            "complaint": row[5],
-        }
-        for row in rows
-    ]
-    return complaints
+async def get_complaints(
+    request: Request,
+    fields: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    after_id: Optional[int] = None,
+):
+    selected = COMPLAINT_FIELDS
+    if fields is not None:
+        # Only select the columns the client asked for, e.g. ?fields=id,product,issue
+        selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in selected if f not in COMPLAINT_COLUMNS]
+        if unknown or not selected:
+            return JSONResponse(status_code=400, content={"error": f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested"})
+    if after_id is not None and limit is None:
+        # A cursor always means paging; never fall back to the full list
+        limit = COMPLAINTS_DEFAULT_PAGE_SIZE
+    if limit is not None or selected != COMPLAINT_FIELDS:
+        full_sql, first_page_sql, next_page_sql = complaint_queries(selected)
+        async with acquire() as conn:
+            if limit is None:
+                rows = await conn.fetch(full_sql)
+            elif after_id is None:
+                # Keyset pagination: one bounded page per request, served by the "Complaint ID" index
+                rows = await conn.fetch(first_page_sql, limit)
+            else:
+                rows = await conn.fetch(next_page_sql, after_id, limit)
+        return [dict(zip(selected, row)) for row in rows]
+    r = app.state.redis
+    if_none_match = request.headers.get("if-none-match")
+    if r is not None:
+        etag, body = await r.mget(COMPLAINTS_ETAG_KEY, COMPLAINTS_CACHE_KEY)
+        if etag is not None and body is not None:
+            etag = etag.decode()
+            if if_none_match == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            return Response(content=body, media_type="application/json", headers={"ETag": etag})
+    async with acquire() as conn:
+        rows = await conn.fetch(COMPLAINTS_SQL)
+    complaints = [complaint_to_dict(row) for row in rows]
+    # Encode once; the same bytes are cached and served until the next save
+    body = orjson.dumps(complaints)
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    if r is not None:
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.set(COMPLAINTS_CACHE_KEY, body, ex=COMPLAINTS_CACHE_TTL)
+            pipe.set(COMPLAINTS_ETAG_KEY, etag, ex=COMPLAINTS_CACHE_TTL)
+            await pipe.execute()
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@app.get("/api/complaints/stream")
+async def stream_complaints():
+    # Server-side cursor: rows are fetched and sent in batches, one JSON object per line
+    async def generate():
+        async with acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(COMPLAINTS_SQL, prefetch=500):
+                    yield orjson.dumps(complaint_to_dict(row)) + b"\n"
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.get("/api/options")
-def get_options():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT DISTINCT "Product", "Sub-product", "Issue", "Sub-issue"
-        FROM public.test
-    ''')
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    # Build unique sets for each dropdown
-    products = set()
-    sub_products = set()
-    issues = set()
-    sub_issues = set()
-    for row in rows:
-        if row[0]: products.add(row[0])
-        if row[1]: sub_products.add(row[1])
-        if row[2]: issues.add(row[2])
-        if row[3]: sub_issues.add(row[3])
-    return {
-        "products": sorted(products),
-        "sub_products": sorted(sub_products),
-        "issues": sorted(issues),
-        "sub_issues": sorted(sub_issues)
-    }
+async def get_options():
+    r = app.state.redis
+    if r is not None:
+        blob = await r.get(OPTIONS_CACHE_KEY)
+        if blob is not None:
+            # Already encoded; serve the cached bytes as-is
+            return Response(content=blob, media_type="application/json")
+    # One sorted distinct list per dropdown, each query on its own pooled connection
+    pool = app.state.pg_pool
+    rows = await asyncio.gather(*(pool.fetch(sql) for sql in OPTIONS_SQL.values()))
+    result = {key: [row[0] for row in col_rows] for key, col_rows in zip(OPTIONS_SQL, rows)}
+    if r is not None:
+        body = orjson.dumps(result)
+        await r.set(OPTIONS_CACHE_KEY, body, ex=OPTIONS_CACHE_TTL)
+        return Response(content=body, media_type="application/json")
+    return result
 
 @app.post("/api/save")
 async def save_ai_response(request: Request):
@@ -102,73 +266,97 @@ async def save_ai_response(request: Request):
     ai_response = data.get('AI_Response')
     ai_issuegroup = data.get('AI_IssueGroup')
     priority = data.get('Priority')
+    # These come straight from the n8n reply (e.g. a numeric Priority); asyncpg only binds str to text columns
+    ai_response, ai_issuegroup, priority = (
+        None if value is None else str(value) for value in (ai_response, ai_issuegroup, priority)
+    )
     product = data.get('Product')
     sub_product = data.get('SubProduct')
     issue = data.get('Issue')
     sub_issue = data.get('SubIssue')
     complaint = data.get('Complaint')
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        if id:
-            # Update existing row
-            cur.execute('''
-                UPDATE public.test
-                SET "AI_Response"=%s, "AI_IssueGroup"=%s, "Priority"=%s
-                WHERE "Complaint ID"=%s
-            ''', (ai_response, ai_issuegroup, priority, id))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return {"success": True}
-        else:
-            # Generate a unique 7-digit Complaint ID
-            cur.execute('SELECT "Complaint ID" FROM public.test')
-            existing_ids = set(row[0] for row in cur.fetchall())
-            max_attempts = 10
-            for _ in range(max_attempts):
-                new_id = random.randint(1000000, 9999999)
-                if new_id not in existing_ids:
-                    break
+        async with acquire() as conn:
+            if id:
+                # Update existing row (asyncpg binds typed parameters, so the form's string ID must be cast)
+                await conn.execute('''
+                    UPDATE public.test
+                    SET "AI_Response"=$1, "AI_IssueGroup"=$2, "Priority"=$3
+                    WHERE "Complaint ID"=$4
+                ''', ai_response, ai_issuegroup, priority, int(id))
+                await invalidate_cache()
+                return {"success": True}
             else:
-                cur.close()
-                conn.close()
-                return JSONResponse(status_code=500, content={"error": "Failed to generate unique Complaint ID"})
-            # Insert new row with correct DB column names
-            cur.execute('''
-                INSERT INTO public.test ("Complaint ID", "Product", "Sub-product", "Issue", "Sub-issue", "Consumer complaint narrative", "AI_Response", "AI_IssueGroup", "Priority")
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ''', (new_id, product, sub_product, issue, sub_issue, complaint, ai_response, ai_issuegroup, priority))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return {"success": True, "id": new_id}
+                # Pick a free random 7-digit Complaint ID and insert in one round-trip
+                new_id = await conn.fetchval(INSERT_COMPLAINT_SQL, product, sub_product, issue, sub_issue, complaint, ai_response, ai_issuegroup, priority)
+                if new_id is None:
+                    return JSONResponse(status_code=500, content={"error": "Failed to generate unique Complaint ID"})
+                await invalidate_cache()
+                return {"success": True, "id": new_id}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+class CircuitBreaker:
+    """Opens after `threshold` failures within `window` seconds, then rejects calls for `cooldown` seconds"""
+
+    def __init__(self, threshold=5, window=30.0, cooldown=30.0):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.failures = deque()
+        self.opened_at = None
+
+    @property
+    def open(self):
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            # Let traffic through again; the next failure re-opens it
+            self.opened_at = None
+            self.failures.clear()
+            return False
+        return True
+
+    def record_success(self):
+        self.failures.clear()
+
+    def record_failure(self):
+        now = time.monotonic()
+        self.failures.append(now)
+        while self.failures and now - self.failures[0] > self.window:
+            self.failures.popleft()
+        if len(self.failures) >= self.threshold:
+            self.opened_at = now
+
+# Cap in-flight forwards and fail fast while n8n is down
+_WEBHOOK_SEM = asyncio.Semaphore(int(os.getenv('WEBHOOK_MAX_CONCURRENCY', 32)))
+_webhook_breaker = CircuitBreaker()
+
 @app.post("/api/webhook")
 async def proxy_to_n8n(request: Request):
     try:
         data = await request.json()
     except Exception:
         return JSONResponse(status_code=400, content={"error": "Invalid request body"})
+    if _webhook_breaker.open:
+        return JSONResponse(status_code=503, content={"error": "upstream unavailable"})
     # Forward the request to n8n
     n8n_url = "https://n8n.leminhnguyen.com/webhook/362992b9-556d-4a7b-9775-ae81a017f206"
-    try:
-        resp = requests.post(n8n_url, json=data, timeout=30)
+    async with _WEBHOOK_SEM:
         try:
-            return JSONResponse(status_code=resp.status_code, content=resp.json())
-        except Exception:
-            return resp.text, resp.status_code
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
+            resp = await app.state.http.post(n8n_url, json=data)
+        except Exception as e:
+            _webhook_breaker.record_failure()
+            return JSONResponse(status_code=500, content={"error": str(e)})
+    if resp.status_code >= 500:
+        _webhook_breaker.record_failure()
+    else:
+        _webhook_breaker.record_success()
+    try:
+        return JSONResponse(status_code=resp.status_code, content=resp.json())
+    except Exception:
+        return Response(content=resp.text, status_code=resp.status_code)
 
 if __name__ == "__main__":
-    app = FastAPI()
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-    )
+    import uvicorn
+    uvicorn.run("backend:app", host="0.0.0.0", port=3001, loop="uvloop", http="httptools")
@@ -0,0 +1,52 @@
+"""One-off migration: create the indexes backend.py's queries rely on.
+
+Run once per database (not per worker) before or after deploying:
+
+    python migrate_indexes.py
+
+CONCURRENTLY builds each index without blocking writes to public.test, but it
+cannot run inside a transaction, so every statement is executed on its own.
+"""
+import asyncio
+import sys
+
+import asyncpg
+
+from backend import PG_CONFIG, DROPDOWN_COLUMNS
+
+INDEX_DDL = (
+    # Collision check for generated Complaint IDs, the UPDATE lookup and keyset pagination
+    'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_test_complaint_id ON public.test ("Complaint ID")',
+    # Partial indexes matching the dropdown DISTINCT queries' predicate
+    *(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_test_{key} ON public.test ("{column}") WHERE "{column}" <> \'\''
+        for key, column in DROPDOWN_COLUMNS
+    ),
+)
+
+async def main():
+    conn = await asyncpg.connect(
+        host=PG_CONFIG.host,
+        database=PG_CONFIG.database,
+        user=PG_CONFIG.user,
+        password=PG_CONFIG.password,
+        port=PG_CONFIG.port,
+        ssl=PG_CONFIG.ssl,
+    )
+    failed = 0
+    try:
+        for ddl in INDEX_DDL:
+            try:
+                await conn.execute(ddl)
+                print(f"ok: {ddl}")
+            except asyncpg.PostgresError as e:
+                # A failed concurrent build leaves an INVALID index behind that IF NOT EXISTS
+                # will skip; drop it (e.g. after removing duplicate Complaint IDs) and re-run
+                failed += 1
+                print(f"failed: {ddl}: {e}", file=sys.stderr)
+    finally:
+        await conn.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -4,48 +4,52 @@ Prompts for the Complaint Dataset Generator Agent
 This module contains all prompt templates used by the AI agent for:
 1. System prompts for conversation/data gathering
 2. Dataset generation prompts
+
+The reference tables are static, so callers pass them in already serialized to
+JSON, and every part of a prompt that depends only on them is rendered once and
+reused; each call only fills in the dynamic fragments.
 """
 
-import json
+import orjson
 
 
-def get_system_prompt(table1: list, table2: list, table8: list, checklist: dict) -> str:
-    """
-    Generate the system prompt for the Gemini model during conversation.
-    
-    Args:
-        table1: The four-tier risk classification taxonomy data
-        table2: The risk subcategory taxonomy with universal patterns
-        table8: The impact scale taxonomy
-        checklist: Current data collection status dict
-        
-    Returns:
-        Formatted system prompt string
-    """
-    table1_str = json.dumps(table1, indent=2)
-    table2_str = json.dumps(table2, indent=2)
-    table8_str = json.dumps(table8, indent=2)
-    
-    checklist_status = []
-    for key, value in checklist.items():
-        status = "✓" if value["collected"] else "○"
-        checklist_status.append(f"  {status} {value['description']}: {value['value'] or 'Not collected'}")
-    
-    return f"""You are an AI assistant helping to generate domain-specific risk classification datasets for businesses.
+# Rendered static prompt blocks, keyed by id() of the template and the table JSON strings
+_rendered_blocks = {}
+
+
+def serialize_table(table: list) -> str:
+    """Serialize a reference table to the indented JSON embedded in prompts"""
+    return orjson.dumps(table, option=orjson.OPT_INDENT_2).decode()
+
+
+def _render_static(template: str, **table_jsons: str) -> str:
+    """Fill a template whose only placeholders are reference tables, once per table set"""
+    key = (id(template), *table_jsons.values())
+    rendered = _rendered_blocks.get(key)
+    if rendered is None:
+        rendered = template.format(**table_jsons)
+        _rendered_blocks[key] = rendered
+    return rendered
+
+
+_SYSTEM_PROMPT_HEAD = """You are an AI assistant helping to generate domain-specific risk classification datasets for businesses.
 
 Your task is to gather information about the user's business through natural conversation, then generate a risk classification dataset with impact scores and detailed descriptions.
 
 ## Reference Classification Taxonomy (Table 1):
-{table1_str}
+{table1}
 
 ## Risk Subcategory Patterns (Table 2):
-{table2_str}
+{table2}
 
 ## Impact Scale (Table 8):
-{table8_str}
+{table8}
+
+"""
+
+_CHECKLIST_HEADING = "## Current Data Collection Status:\n"
 
-## Current Data Collection Status:
-{chr(10).join(checklist_status)}
+_SYSTEM_PROMPT_TAIL = """
 
 ## Your Goals:
 1. Engage in friendly, professional conversation to gather business details
@@ -66,71 +70,58 @@ Always respond naturally in conversation. When extracting information, internall
 
 At the end of your response, include a JSON block with extracted data (if any new data was collected):
 ```json
-{{
-    "extracted_data": {{
+{
+    "extracted_data": {
         "industry": "value or null",
         "business_description": "value or null",
         "target_customers": "value or null",
         "main_products_services": "value or null",
         "common_pain_points": "value or null",
         "specific_terminology": "value or null"
-    }},
+    },
     "ready_to_generate": true/false
-}}
+}
 ```
 Only include fields that were newly mentioned in this message. Use null for fields not mentioned.
 """
 
-
-def get_generation_prompt(collected_data: dict, table1: list, table2: list, table8: list) -> str:
-    """
-    Generate the prompt for dataset generation.
-    
-    Args:
-        collected_data: Dictionary containing all collected business information
-        table1: The four-tier risk classification taxonomy data
-        table2: The risk subcategory taxonomy with universal patterns
-        table8: The impact scale taxonomy
-        
-    Returns:
-        Formatted generation prompt string
-    """
-    table1_str = json.dumps(table1, indent=2)
-    table2_str = json.dumps(table2, indent=2)
-    table8_str = json.dumps(table8, indent=2)
-    
-    return f"""Based on the following business information, generate a domain-specific risk classification dataset in CSV format.
-
+_BUSINESS_INFO = """
 ## Business Information:
-- Industry: {collected_data['industry']}
-- Description: {collected_data['business_description']}
-- Target Customers: {collected_data['target_customers']}
-- Products/Services: {collected_data['main_products_services']}
-- Common Pain Points: {collected_data['common_pain_points'] or 'Not specified'}
-- Industry Terminology: {collected_data['specific_terminology'] or 'Not specified'}
+- Industry: {industry}
+- Description: {business_description}
+- Target Customers: {target_customers}
+- Products/Services: {main_products_services}
+- Common Pain Points: {common_pain_points}
+- Industry Terminology: {specific_terminology}
+"""
 
+_REFERENCE_TABLES = """
 ## Reference Tables:
 Table 1 (Risk Categories):
-{table1_str}
+{table1}
 
 Table 2 (Subcategories with patterns):
-{table2_str}
+{table2}
 
 Table 8 (Impact Scale):
-{table8_str}
+{table8}
 
 ## Task:
-Generate a CSV dataset with the following format:
+"""
+
+_GENERATION_INTRO = "Based on the following business information, generate a domain-specific risk classification dataset in CSV format.\n"
+
+_GENERATION_TASK = """Generate a CSV dataset with the following format:
 - Column 1: Risk Code (matching the subcategory codes from Table 2: ER-01, ER-02, ..., SR-04)
-- Column 2: Impact Score (1-5 based on Table 8, considering the severity in the context of {collected_data['industry']})
+- Column 2: Impact Score (1-5 based on Table 8, considering the severity in the context of {industry})
 - Column 3: Description (the name of this risk, adapted to the business context - based on the Subcategory Name from Table 2)
 
 Generate exactly 20 rows (one for each subcategory code from Table 2), with:
 1. Risk codes matching Table 2 subcategories
-2. Impact scores (1-5) appropriate for {collected_data['industry']} based on how severely each risk would affect this specific business
+2. Impact scores (1-5) appropriate for {industry} based on how severely each risk would affect this specific business
 3. Risk names (in the Description column) that:
    - Are based on the Subcategory Name from Table 2
-   - Are adapted/customized for {collected_data['industry']} context
+   - Are adapted/customized for {industry} context
    - Are concise (2-5 words)
 
 Output ONLY the CSV content, starting with the header row. Each description should be in quotes.
@@ -139,40 +130,9 @@ Risk Code,Impact Score,Description
 ER-01,4,"Market Competition"
 """
 
+_REGENERATION_INTRO = "Based on the following business information and user feedback, regenerate a domain-specific risk classification dataset in CSV format.\n"
 
-# System message for chat initialization
-SYSTEM_ACKNOWLEDGMENT = "I understand. I'll help gather information about the user's business and generate a complaint dataset. I'll ask questions conversationally and track the checklist progress."
-
-
-def get_regeneration_prompt(collected_data: dict, table1: list, table2: list, table8: list, feedback: str, previous_dataset: str) -> str:
-    """
-    Generate a prompt for dataset regeneration based on user feedback.
-    
-    Args:
-        collected_data: Dictionary containing all collected business information
-        table1: The four-tier risk classification taxonomy data
-        table2: The risk subcategory taxonomy with universal patterns
-        table8: The impact scale taxonomy
-        feedback: User's feedback on the previous dataset
-        previous_dataset: The previously generated dataset CSV content
-        
-    Returns:
-        Formatted regeneration prompt string
-    """
-    table1_str = json.dumps(table1, indent=2)
-    table2_str = json.dumps(table2, indent=2)
-    table8_str = json.dumps(table8, indent=2)
-    
-    return f"""Based on the following business information and user feedback, regenerate a domain-specific risk classification dataset in CSV format.
-
-## Business Information:
-- Industry: {collected_data['industry']}
-- Description: {collected_data['business_description']}
-- Target Customers: {collected_data['target_customers']}
-- Products/Services: {collected_data['main_products_services']}
-- Common Pain Points: {collected_data['common_pain_points'] or 'Not specified'}
-- Industry Terminology: {collected_data['specific_terminology'] or 'Not specified'}
-
+_REGENERATION_FEEDBACK = """
 ## Previous Dataset (to be improved):
 ```csv
 {previous_dataset}
@@ -180,29 +140,19 @@ def get_regeneration_prompt(collected_data: dict, table1: list, table2: list, ta
 
 ## User Feedback on Previous Dataset:
 {feedback}
+"""
 
-## Reference Tables:
-Table 1 (Risk Categories):
-{table1_str}
-
-Table 2 (Subcategories with patterns):
-{table2_str}
-
-Table 8 (Impact Scale):
-{table8_str}
-
-## Task:
-Regenerate a CSV dataset with the following format, taking into account the user feedback and improving upon the previous dataset:
+_REGENERATION_TASK = """Regenerate a CSV dataset with the following format, taking into account the user feedback and improving upon the previous dataset:
 - Column 1: Risk Code (matching the subcategory codes from Table 2: ER-01, ER-02, ..., SR-04)
-- Column 2: Impact Score (1-5 based on Table 8, considering the severity in the context of {collected_data['industry']})
+- Column 2: Impact Score (1-5 based on Table 8, considering the severity in the context of {industry})
 - Column 3: Description (the name of this risk, adapted to the business context - based on the Subcategory Name from Table 2)
 
 Generate exactly 20 rows (one for each subcategory code from Table 2), with:
 1. Risk codes matching Table 2 subcategories
-2. Impact scores (1-5) appropriate for {collected_data['industry']} based on how severely each risk would affect this specific business
+2. Impact scores (1-5) appropriate for {industry} based on how severely each risk would affect this specific business
 3. Risk names (in the Description column) that:
    - Are based on the Subcategory Name from Table 2
-   - Are adapted/customized for {collected_data['industry']} context
+   - Are adapted/customized for {industry} context
    - Are concise (2-5 words)
    - Address the user's feedback
 
@@ -211,3 +161,120 @@ Example format:
 Risk Code,Impact Score,Description
 ER-01,4,"Market Competition"
 """
+
+
+# The task sections only interpolate the industry, so they are pre-split around it
+# once and joined per call instead of being re-parsed by str.format
+_GENERATION_TASK_PARTS = _GENERATION_TASK.split("{industry}")
+_REGENERATION_TASK_PARTS = _REGENERATION_TASK.split("{industry}")
+
+
+def _business_info(collected_data: dict) -> str:
+    """Render the business information section from the collected data"""
+    return _BUSINESS_INFO.format(
+        industry=collected_data['industry'],
+        business_description=collected_data['business_description'],
+        target_customers=collected_data['target_customers'],
+        main_products_services=collected_data['main_products_services'],
+        common_pain_points=collected_data['common_pain_points'] or 'Not specified',
+        specific_terminology=collected_data['specific_terminology'] or 'Not specified'
+    )
+
+
+def get_system_prompt(table1_json: str, table2_json: str, table8_json: str, checklist: dict) -> str:
+    """
+    Generate the system prompt for the Gemini model during conversation.
+    
+    Args:
+        table1_json: The four-tier risk classification taxonomy, serialized with serialize_table
+        table2_json: The risk subcategory taxonomy with universal patterns, serialized
+        table8_json: The impact scale taxonomy, serialized
+        checklist: Current data collection status dict
+        
+    Returns:
+        Formatted system prompt string
+    """
+    return (
+        _render_static(_SYSTEM_PROMPT_HEAD, table1=table1_json, table2=table2_json, table8=table8_json)
+        + get_checklist_prompt(checklist)
+        + _SYSTEM_PROMPT_TAIL
+    )
+
+
+def get_static_system_prompt(table1_json: str, table2_json: str, table8_json: str) -> str:
+    """
+    Generate the part of the system prompt that is the same for every turn of every session.
+    
+    This is everything in get_system_prompt except the checklist status, so it
+    can be uploaded once as Gemini cached content; the checklist is then sent
+    with each turn via get_checklist_prompt.
+    
+    Args:
+        table1_json: The four-tier risk classification taxonomy, serialized with serialize_table
+        table2_json: The risk subcategory taxonomy with universal patterns, serialized
+        table8_json: The impact scale taxonomy, serialized
+        
+    Returns:
+        Static system prompt string
+    """
+    return (
+        _render_static(_SYSTEM_PROMPT_HEAD, table1=table1_json, table2=table2_json, table8=table8_json).rstrip()
+        + _SYSTEM_PROMPT_TAIL
+    )
+
+
+def get_checklist_prompt(checklist: dict) -> str:
+    """Render the current data collection status section from the checklist"""
+    return _CHECKLIST_HEADING + "\n".join(
+        f"  {'✓' if value['collected'] else '○'} {value['description']}: {value['value'] or 'Not collected'}"
+        for value in checklist.values()
+    )
+
+
+def get_generation_prompt(collected_data: dict, table1_json: str, table2_json: str, table8_json: str) -> str:
+    """
+    Generate the prompt for dataset generation.
+    
+    Args:
+        collected_data: Dictionary containing all collected business information
+        table1_json: The four-tier risk classification taxonomy, serialized with serialize_table
+        table2_json: The risk subcategory taxonomy with universal patterns, serialized
+        table8_json: The impact scale taxonomy, serialized
+        
+    Returns:
+        Formatted generation prompt string
+    """
+    return "".join((
+        _GENERATION_INTRO,
+        _business_info(collected_data),
+        _render_static(_REFERENCE_TABLES, table1=table1_json, table2=table2_json, table8=table8_json),
+        str(collected_data['industry']).join(_GENERATION_TASK_PARTS)
+    ))
+
+
+# System message for chat initialization
+SYSTEM_ACKNOWLEDGMENT = "I understand. I'll help gather information about the user's business and generate a complaint dataset. I'll ask questions conversationally and track the checklist progress."
+
+
+def get_regeneration_prompt(collected_data: dict, table1_json: str, table2_json: str, table8_json: str, feedback: str, previous_dataset: str) -> str:
+    """
+    Generate a prompt for dataset regeneration based on user feedback.
+    
+    Args:
+        collected_data: Dictionary containing all collected business information
+        table1_json: The four-tier risk classification taxonomy, serialized with serialize_table
+        table2_json: The risk subcategory taxonomy with universal patterns, serialized
+        table8_json: The impact scale taxonomy, serialized
+        feedback: User's feedback on the previous dataset
+        previous_dataset: The previously generated dataset CSV content
+        
+    Returns:
+        Formatted regeneration prompt string
+    """
+    return "".join((
+        _REGENERATION_INTRO,
+        _business_info(collected_data),
+        _REGENERATION_FEEDBACK.format(previous_dataset=previous_dataset, feedback=feedback),
+        _render_static(_REFERENCE_TABLES, table1=table1_json, table2=table2_json, table8=table8_json),
+        str(collected_data['industry']).join(_REGENERATION_TASK_PARTS)
+    ))
@@ -7,29 +7,40 @@ to interactively gather business details and generate tailored risk examples.
 
 Architecture:
 - APIRouter for modular FastAPI integration
-- Session-based conversation management (in-memory, resets on server restart)
+- Session-based conversation management (in Redis when REDIS_URL is set, otherwise in-memory)
 - Google Gemini API integration for intelligent conversation and generation
 - CSV generation and download capabilities
 """
 
 import os
 import sys
-import json
+import re
 import csv
-import io
+import pickle
 import uuid
+import hashlib
+import asyncio
 import traceback
-from typing import Optional
-from datetime import datetime
+from typing import Optional, ClassVar
+from dataclasses import dataclass, asdict, astuple
+from datetime import datetime, timedelta
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
+import numpy as np
+import orjson
 import google.generativeai as genai
+from google.generativeai import caching
+import redis.asyncio as redis
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
 
-from .prompts import get_system_prompt, get_generation_prompt, get_regeneration_prompt, SYSTEM_ACKNOWLEDGMENT
+from .prompts import (
+    get_system_prompt, get_static_system_prompt, get_checklist_prompt, get_generation_prompt,
+    get_regeneration_prompt, serialize_table, SYSTEM_ACKNOWLEDGMENT
+)
 
 # Load environment variables from root .env
 ROOT_DIR = Path(__file__).resolve().parent.parent.parent.parent
@@ -38,38 +49,198 @@ load_dotenv(ROOT_DIR / ".env")
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# The model client is stateless apart from its configuration, so every session shares one
+MODEL = genai.GenerativeModel("gemini-2.5-flash")
+
 # Data directory for reference tables (shared across layers)
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 
 # Create router for Layer 1
 router = APIRouter()
 
-# In-memory session storage (resets on server restart)
-sessions = {}
+# Sessions live in Redis when REDIS_URL is set, so they survive restarts and are
+# shared by all workers; sessions idle for L1_SESSION_TTL_SECONDS expire either way
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = redis.from_url(REDIS_URL) if REDIS_URL else None
+SESSION_TTL_SECONDS = int(os.getenv("L1_SESSION_TTL_SECONDS", "3600"))
+SESSION_EXPIRE_INTERVAL_SECONDS = 60
+
+# In-memory session storage when Redis is not used (resets on server restart);
+# the least recently used sessions go first when full
+sessions = TTLCache(maxsize=int(os.getenv("L1_MAX_SESSIONS", "10000")), ttl=SESSION_TTL_SECONDS)
+
+
+# Most dataset variants one /regenerate_batch call may request
+MAX_REGENERATE_VARIANTS = int(os.getenv("L1_MAX_REGENERATE_VARIANTS", "5"))
+
+# Past user/model exchanges sent with each chat turn
+HISTORY_TURNS = int(os.getenv("L1_HISTORY_TURNS", "6"))
+
+# Replies to opening messages, keyed by (collected values, normalized message)
+chat_response_cache = LRUCache(maxsize=int(os.getenv("L1_CHAT_CACHE_SIZE", "4096")))
+
+# Generation requests whose inputs embed within this cosine similarity share a dataset
+EMBEDDING_MODEL = "models/text-embedding-004"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("L1_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("L1_SEMANTIC_CACHE_SIZE", "1024"))
+
+
+class SemanticCache:
+    """Generated datasets keyed by an embedding of their inputs; near-duplicate inputs reuse a dataset.
+    
+    Each entry also carries an exact key: only entries whose exact key matches are compared by similarity.
+    """
+    
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._vectors = None  # (n, dim) matrix of unit-length embeddings
+        self._exact_keys = []
+        self._datasets = []
+    
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed the cache key text as a unit vector, or None if the embedding call fails"""
+        try:
+            result = await asyncio.to_thread(genai.embed_content, model=EMBEDDING_MODEL, content=text)
+        except Exception:
+            traceback.print_exc()
+            return None
+        vector = np.asarray(result["embedding"], dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+    
+    def lookup(self, vector: Optional[np.ndarray], exact_key: str = "") -> Optional[str]:
+        """Return the dataset of the most similar cached input with the same exact key, if it is similar enough"""
+        if vector is None or self._vectors is None:
+            return None
+        candidates = [i for i, key in enumerate(self._exact_keys) if key == exact_key]
+        if not candidates:
+            return None
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return self._datasets[candidates[best]]
+        return None
+    
+    def add(self, vector: Optional[np.ndarray], dataset: str, exact_key: str = ""):
+        """Cache a dataset, dropping the oldest entries beyond max_entries"""
+        if vector is None:
+            return
+        self._vectors = vector[np.newaxis, :] if self._vectors is None else np.vstack((self._vectors, vector))
+        self._exact_keys.append(exact_key)
+        self._datasets.append(dataset)
+        if len(self._datasets) > self.max_entries:
+            self._vectors = self._vectors[-self.max_entries:]
+            self._exact_keys = self._exact_keys[-self.max_entries:]
+            self._datasets = self._datasets[-self.max_entries:]
+
+
+def _cache_text(collected: dict) -> str:
+    """The business details as plain text, embedded as the semantic cache key"""
+    return "\n".join(str(collected[name]) for name, _ in CollectedData.FIELDS if collected[name] is not None)
+
+
+def _regeneration_key(feedback: str, previous_dataset: str) -> str:
+    """Exact cache key for a regeneration: the feedback and dataset must match, not merely be similar"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(feedback.encode())
+    digest.update(b"\0")
+    digest.update(previous_dataset.encode())
+    return digest.hexdigest()
+
+
+# Generated datasets for near-identical business details (and, for regeneration, the same feedback and dataset)
+generation_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+regeneration_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+
 
 # Load reference tables
+def _load_table(filename: str) -> list:
+    """
+    Load a reference CSV as a list of row dicts.
+    
+    The parsed rows are pickled next to the CSV and reused on later starts
+    while the pickle is newer than the CSV; a read-only data directory just
+    means the CSV is parsed every time.
+    """
+    csv_path = DATA_DIR / filename
+    pickle_path = csv_path.with_suffix(".pkl")
+    try:
+        if os.path.getmtime(pickle_path) >= os.path.getmtime(csv_path):
+            with open(pickle_path, "rb") as f:
+                return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    
+    with open(csv_path, "r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        table = [dict(zip(header, row)) for row in reader if row]
+    
+    try:
+        with open(pickle_path, "wb") as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return table
+
 def load_table1():
     """Load the four-tier risk classification taxonomy"""
-    with open(DATA_DIR / "table1_four-tier_risk_classification_taxonomy.csv", "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+    return _load_table("table1_four-tier_risk_classification_taxonomy.csv")
 
 def load_table2():
     """Load the risk subcategory taxonomy with universal patterns"""
-    with open(DATA_DIR / "table2_risk_subcategory_taxonomy_with_universal_patterns.csv", "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+    return _load_table("table2_risk_subcategory_taxonomy_with_universal_patterns.csv")
 
 def load_table8():
     """Load the impact scale taxonomy"""
-    with open(DATA_DIR / "table8_impact_scale.csv", "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+    return _load_table("table8_impact_scale.csv")
 
 TABLE1 = load_table1()
 TABLE2 = load_table2()
 TABLE8 = load_table8()
 
+# The tables never change, so serialize them for the prompts once
+TABLE1_JSON = serialize_table(TABLE1)
+TABLE2_JSON = serialize_table(TABLE2)
+TABLE8_JSON = serialize_table(TABLE8)
+
+
+# The static part of the system prompt (taxonomy tables, goals, response format) is
+# uploaded once as Gemini cached content when L1_CONTEXT_CACHE is on; turns then only
+# send the checklist status and history. If caching is unavailable, every turn sends
+# the full system prompt as before.
+CONTEXT_CACHE_ENABLED = os.getenv("L1_CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_TTL = timedelta(hours=1)
+CONTEXT_CACHE_RETRY = timedelta(minutes=5)
+_context_cache = {"model": None, "refresh_at": datetime.min}
+_context_cache_lock = asyncio.Lock()
+
+
+async def get_context_cached_model() -> Optional[genai.GenerativeModel]:
+    """Return a model bound to the cached static system prompt, creating or renewing the cache as needed"""
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    async with _context_cache_lock:
+        now = datetime.now()
+        if now < _context_cache["refresh_at"]:
+            return _context_cache["model"]
+        try:
+            cached_content = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model="models/gemini-2.5-flash",
+                system_instruction=get_static_system_prompt(TABLE1_JSON, TABLE2_JSON, TABLE8_JSON),
+                ttl=CONTEXT_CACHE_TTL
+            )
+            model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+            # Renew a little before the cache expires on the server
+            refresh_at = now + CONTEXT_CACHE_TTL - CONTEXT_CACHE_RETRY
+        except Exception:
+            traceback.print_exc()
+            model = None
+            refresh_at = now + CONTEXT_CACHE_RETRY
+        _context_cache.update(model=model, refresh_at=refresh_at)
+        return model
+
 
 # Pydantic models
 class MessageRequest(BaseModel):
@@ -86,6 +257,31 @@ class MessageResponse(BaseModel):
 class RegenerateRequest(BaseModel):
     feedback: str
 
+class RegenerateBatchRequest(BaseModel):
+    feedbacks: list[str]
+
+@dataclass(slots=True)
+class CollectedData:
+    """Business details gathered during the conversation"""
+    industry: Optional[str] = None
+    business_description: Optional[str] = None
+    target_customers: Optional[str] = None
+    main_products_services: Optional[str] = None
+    common_pain_points: Optional[str] = None
+    specific_terminology: Optional[str] = None
+    
+    # (field, checklist description) in display order
+    FIELDS: ClassVar[tuple] = (
+        ("industry", "Industry/Domain Type"),
+        ("business_description", "Business Description"),
+        ("target_customers", "Target Customer Profile"),
+        ("main_products_services", "Main Products/Services"),
+        ("common_pain_points", "Common Customer Pain Points"),
+        ("specific_terminology", "Industry-Specific Terminology")
+    )
+    FIELD_NAMES: ClassVar[frozenset] = frozenset(name for name, _ in FIELDS)
+
+
 class Session:
     """Manages conversation state and data collection for a single user session"""
     
@@ -93,121 +289,205 @@ class Session:
         self.session_id = session_id
         self.created_at = datetime.now()
         self.conversation_history = []
-        self.collected_data = {
-            "industry": None,
-            "business_description": None,
-            "target_customers": None,
-            "main_products_services": None,
-            "common_pain_points": None,
-            "specific_terminology": None
-        }
+        self.collected_data = CollectedData()
+        # Checklist and completeness derived from collected_data, rebuilt only after it changes
+        self._checklist = None
+        self._is_complete = False
+        self._dirty = True
         self.generated_dataset = None
         self.dataset_iterations = []  # Track all dataset versions
         self.feedback_history = []  # Track all feedback provided
         self.current_iteration = 0  # Counter for regenerations
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+        self._prompt_cache: dict[tuple, str] = {}  # System prompts keyed by collected values
+        self._deleted = False  # Set once removed from the store; save() then does nothing
     
-    def get_checklist(self) -> dict:
-        """Return the current status of data collection checklist"""
+    def to_dict(self) -> dict:
+        """Serialize the conversation state (not caches) for the shared store"""
         return {
-            "industry": {
-                "collected": self.collected_data["industry"] is not None,
-                "value": self.collected_data["industry"],
-                "description": "Industry/Domain Type"
-            },
-            "business_description": {
-                "collected": self.collected_data["business_description"] is not None,
-                "value": self.collected_data["business_description"],
-                "description": "Business Description"
-            },
-            "target_customers": {
-                "collected": self.collected_data["target_customers"] is not None,
-                "value": self.collected_data["target_customers"],
-                "description": "Target Customer Profile"
-            },
-            "main_products_services": {
-                "collected": self.collected_data["main_products_services"] is not None,
-                "value": self.collected_data["main_products_services"],
-                "description": "Main Products/Services"
-            },
-            "common_pain_points": {
-                "collected": self.collected_data["common_pain_points"] is not None,
-                "value": self.collected_data["common_pain_points"],
-                "description": "Common Customer Pain Points"
-            },
-            "specific_terminology": {
-                "collected": self.collected_data["specific_terminology"] is not None,
-                "value": self.collected_data["specific_terminology"],
-                "description": "Industry-Specific Terminology"
-            }
+            "session_id": self.session_id,
+            "created_at": self.created_at.isoformat(),
+            "conversation_history": self.conversation_history,
+            "collected_data": asdict(self.collected_data),
+            "generated_dataset": self.generated_dataset,
+            "dataset_iterations": self.dataset_iterations,
+            "feedback_history": self.feedback_history,
+            "current_iteration": self.current_iteration
         }
     
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        """Rebuild a session from to_dict() output"""
+        session = cls(data["session_id"])
+        session.created_at = datetime.fromisoformat(data["created_at"])
+        session.conversation_history = data["conversation_history"]
+        session.collected_data = CollectedData(**data["collected_data"])
+        session.generated_dataset = data["generated_dataset"]
+        session.dataset_iterations = data["dataset_iterations"]
+        session.feedback_history = data["feedback_history"]
+        session.current_iteration = data["current_iteration"]
+        return session
+    
+    async def save(self):
+        """Persist the session, restarting its TTL"""
+        if redis_client is None:
+            # A request still running on a deleted session must not bring it back
+            if not self._deleted:
+                sessions[self.session_id] = self
+            return
+        await redis_client.set(_session_key(self.session_id), orjson.dumps(self.to_dict()), ex=SESSION_TTL_SECONDS)
+    
+    def _refresh_derived(self):
+        """Rebuild the checklist and completeness flag from collected_data"""
+        data = self.collected_data
+        checklist = {}
+        for name, description in CollectedData.FIELDS:
+            value = getattr(data, name)
+            checklist[name] = {"collected": value is not None, "value": value, "description": description}
+        self._checklist = checklist
+        self._is_complete = (
+            data.industry is not None
+            and data.business_description is not None
+            and data.target_customers is not None
+            and data.main_products_services is not None
+        )
+        self._dirty = False
+    
+    def get_checklist(self) -> dict:
+        """Return the current status of data collection checklist"""
+        if self._dirty:
+            self._refresh_derived()
+        return self._checklist
+    
+    def set_collected(self, key: str, value: str):
+        """Record a collected value and mark the derived checklist state stale"""
+        setattr(self.collected_data, key, value)
+        self._dirty = True
+    
+    def get_system_prompt(self) -> str:
+        """Return the system prompt for the current checklist state, building it once per state"""
+        key = astuple(self.collected_data)
+        system_prompt = self._prompt_cache.get(key)
+        if system_prompt is None:
+            system_prompt = get_system_prompt(TABLE1_JSON, TABLE2_JSON, TABLE8_JSON, self.get_checklist())
+            self._prompt_cache[key] = system_prompt
+        return system_prompt
+    
     def is_data_complete(self) -> bool:
         """Check if all required data has been collected"""
-        required_fields = ["industry", "business_description", "target_customers", "main_products_services"]
-        return all(self.collected_data.get(field) is not None for field in required_fields)
+        if self._dirty:
+            self._refresh_derived()
+        return self._is_complete
 
     async def process_message(self, user_message: str) -> str:
         """Process a user message and return the agent's response"""
+        # An opening message has no history to depend on, so its reply can be shared across sessions
+        cache_key = None
+        if not self.conversation_history:
+            cache_key = (astuple(self.collected_data), user_message.strip().lower())
+        
         self.conversation_history.append({
             "role": "user",
             "parts": [user_message]
         })
         
-        # Build the chat with system prompt and history
-        system_prompt = get_system_prompt(TABLE1, TABLE2, TABLE8, self.get_checklist())
-        chat = self.model.start_chat(history=[
-            {"role": "user", "parts": [system_prompt]},
-            {"role": "model", "parts": [SYSTEM_ACKNOWLEDGMENT]},
-            *self.conversation_history[:-1]  # Previous history
-        ])
-        
-        # Send the current message
-        response = chat.send_message(user_message)
-        response_text = response.text
+        cached = chat_response_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            response_text, extracted_data = cached
+        else:
+            # Build the chat with system prompt and history; with a cached static
+            # prompt only the checklist status has to be sent
+            cached_model = await get_context_cached_model()
+            if cached_model is not None:
+                chat_model, system_prompt = cached_model, get_checklist_prompt(self.get_checklist())
+            else:
+                chat_model, system_prompt = MODEL, self.get_system_prompt()
+            chat = chat_model.start_chat(history=[
+                {"role": "user", "parts": [system_prompt]},
+                {"role": "model", "parts": [SYSTEM_ACKNOWLEDGMENT]},
+                # Only the last HISTORY_TURNS exchanges before the current message (which
+                # ends the history), starting on a user turn; older facts are in the checklist
+                *self.conversation_history[-(2 * HISTORY_TURNS + 1):-1]
+            ])
+            
+            # Send the current message
+            response = await chat.send_message_async(user_message)
+            response_text, extracted_data = _split_reply(response.text)
+            if cache_key is not None:
+                chat_response_cache[cache_key] = (response_text, extracted_data)
         
-        # Extract JSON data from response
-        try:
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                json_str = response_text[json_start:json_end].strip()
-                extracted = json.loads(json_str)
-                
-                # Update collected data
-                if "extracted_data" in extracted:
-                    for key, value in extracted["extracted_data"].items():
-                        if value is not None and key in self.collected_data:
-                            self.collected_data[key] = value
-                
-                # Remove JSON block from response for cleaner display
-                response_text = response_text[:response_text.find("```json")].strip()
-        except (json.JSONDecodeError, ValueError):
-            pass
+        # Update collected data
+        for key, value in extracted_data.items():
+            if value is not None and key in CollectedData.FIELD_NAMES:
+                self.set_collected(key, value)
         
         self.conversation_history.append({
             "role": "model",
             "parts": [response_text]
         })
+        await self.save()
         
         return response_text
 
+    async def _generate_csv(self, prompt: str, cache: SemanticCache, cache_text: str, exact_key: str = "") -> str:
+        """Run a generation prompt, reusing a cached dataset generated for near-identical inputs"""
+        vector = await cache.embed(cache_text)
+        csv_content = cache.lookup(vector, exact_key)
+        if csv_content is not None:
+            return csv_content
+        
+        response = await MODEL.generate_content_async(prompt)
+        csv_content = _clean_csv(response.text)
+        
+        cache.add(vector, csv_content, exact_key)
+        return csv_content
+
     async def generate_dataset(self) -> str:
         """Generate the risk classification dataset based on collected information"""
         if not self.is_data_complete():
             return None
         
-        generation_prompt = get_generation_prompt(self.collected_data, TABLE1, TABLE2, TABLE8)
+        collected = asdict(self.collected_data)
+        generation_prompt = get_generation_prompt(collected, TABLE1_JSON, TABLE2_JSON, TABLE8_JSON)
+        
+        csv_content = await self._generate_csv(
+            generation_prompt, generation_cache, _cache_text(collected)
+        )
+        
+        self._record_generated(csv_content)
+        await self.save()
+        return csv_content
 
-        response = self.model.generate_content(generation_prompt)
-        csv_content = response.text.strip()
+    async def stream_dataset(self):
+        """Generate the dataset like generate_dataset, yielding the CSV text as Gemini produces it"""
+        collected = asdict(self.collected_data)
+        generation_prompt = get_generation_prompt(collected, TABLE1_JSON, TABLE2_JSON, TABLE8_JSON)
         
-        # Clean up the response if it contains markdown code blocks
-        if "```csv" in csv_content:
-            csv_content = csv_content.split("```csv")[1].split("```")[0].strip()
-        elif "```" in csv_content:
-            csv_content = csv_content.split("```")[1].split("```")[0].strip()
+        vector = await generation_cache.embed(_cache_text(collected))
+        csv_content = generation_cache.lookup(vector)
+        if csv_content is None:
+            fence_filter = _CsvFenceFilter()
+            chunks = []
+            response = await MODEL.generate_content_async(generation_prompt, stream=True)
+            async for chunk in response:
+                chunks.append(chunk.text)
+                text = fence_filter.feed(chunk.text)
+                if text:
+                    yield text
+            tail = fence_filter.flush()
+            if tail:
+                yield tail
+            
+            # Store exactly what the buffered path would have produced
+            csv_content = _clean_csv("".join(chunks))
+            generation_cache.add(vector, csv_content)
+        else:
+            yield csv_content
         
+        self._record_generated(csv_content)
+        await self.save()
+
+    def _record_generated(self, csv_content: str):
+        """Make a newly generated dataset current and record it as an iteration without feedback"""
         self.generated_dataset = csv_content
         self.dataset_iterations.append({
             "iteration": self.current_iteration,
@@ -215,7 +495,6 @@ class Session:
             "feedback": None,
             "timestamp": datetime.now().isoformat()
         })
-        return csv_content
 
     async def regenerate_dataset(self, feedback: str) -> str:
         """Regenerate the dataset based on user feedback"""
@@ -235,17 +514,7 @@ class Session:
         # Increment iteration counter
         self.current_iteration += 1
         
-        # Get regeneration prompt with feedback and previous dataset
-        regeneration_prompt = get_regeneration_prompt(self.collected_data, TABLE1, TABLE2, TABLE8, feedback, previous_dataset)
-        
-        response = self.model.generate_content(regeneration_prompt)
-        csv_content = response.text.strip()
-        
-        # Clean up the response if it contains markdown code blocks
-        if "```csv" in csv_content:
-            csv_content = csv_content.split("```csv")[1].split("```")[0].strip()
-        elif "```" in csv_content:
-            csv_content = csv_content.split("```")[1].split("```")[0].strip()
+        csv_content = await self._regenerate_variant(feedback, previous_dataset)
         
         self.generated_dataset = csv_content
         self.dataset_iterations.append({
@@ -254,17 +523,197 @@ class Session:
             "feedback": feedback,
             "timestamp": datetime.now().isoformat()
         })
+        await self.save()
         return csv_content
 
+    async def regenerate_batch(self, feedbacks: list) -> list:
+        """Regenerate one variant of the current dataset per feedback, all requested concurrently"""
+        if not self.is_data_complete():
+            return None
+        
+        # Every variant improves the same previous dataset
+        previous_dataset = self.generated_dataset
+        base_iteration = self.current_iteration
+        
+        for feedback in feedbacks:
+            self.feedback_history.append({
+                "iteration": base_iteration,
+                "feedback": feedback,
+                "timestamp": datetime.now().isoformat()
+            })
+        self.current_iteration += len(feedbacks)
+        
+        variants = await asyncio.gather(*(
+            self._regenerate_variant(feedback, previous_dataset) for feedback in feedbacks
+        ))
+        
+        for offset, (feedback, csv_content) in enumerate(zip(feedbacks, variants), start=1):
+            self.dataset_iterations.append({
+                "iteration": base_iteration + offset,
+                "dataset": csv_content,
+                "feedback": feedback,
+                "timestamp": datetime.now().isoformat()
+            })
+        # The last variant becomes the current dataset, matching its iteration number
+        self.generated_dataset = variants[-1]
+        await self.save()
+        return variants
+
+    async def _regenerate_variant(self, feedback: str, previous_dataset: str) -> str:
+        """Run the regeneration prompt for one piece of feedback on the given dataset"""
+        # Get regeneration prompt with feedback and previous dataset
+        collected = asdict(self.collected_data)
+        regeneration_prompt = get_regeneration_prompt(collected, TABLE1_JSON, TABLE2_JSON, TABLE8_JSON, feedback, previous_dataset)
+        
+        return await self._generate_csv(
+            regeneration_prompt,
+            regeneration_cache,
+            _cache_text(collected),
+            _regeneration_key(feedback, previous_dataset)
+        )
+
+
+# A ``` / ```csv code block around the CSV; a missing closing fence runs to the end
+_CSV_FENCE_RE = re.compile(r"```(?:csv)?\s*(.*?)(?:```|\Z)", re.DOTALL)
+
+
+def _clean_csv(text: str) -> str:
+    """Return the CSV body of a generation reply, without any markdown code fence"""
+    match = _CSV_FENCE_RE.search(text)
+    return match.group(1).strip() if match else text.strip()
+
+
+class _CsvFenceFilter:
+    """Apply _clean_csv to a streamed reply one chunk at a time: emit only the body of the first ``` / ```csv block.
+    
+    Text before the first fence is held back rather than emitted; a reply with no fence at all is only known
+    once the stream ends, so it comes out whole from flush().
+    """
+    
+    def __init__(self):
+        self._pending = ""
+        self._stage = "prose"  # prose -> lang -> space -> body -> done
+    
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the text that is safe to emit"""
+        if self._stage == "done":
+            return ""
+        self._pending += chunk
+        
+        if self._stage == "prose":
+            start = self._pending.find("```")
+            if start == -1:
+                return ""
+            self._pending = self._pending[start + 3:]
+            self._stage = "lang"
+        
+        if self._stage == "lang":
+            if "csv".startswith(self._pending):
+                return ""  # Wait until it is clear whether the fence is tagged csv
+            if self._pending.startswith("csv"):
+                self._pending = self._pending[3:]
+            self._stage = "space"
+        
+        if self._stage == "space":
+            self._pending = self._pending.lstrip()
+            if not self._pending:
+                return ""
+            self._stage = "body"
+        
+        end = self._pending.find("```")
+        if end != -1:
+            self._stage = "done"
+            text, self._pending = self._pending[:end].rstrip(), ""
+            return text
+        # Hold back a possible partial closing fence, and whitespace that may turn out to be trailing
+        text = self._pending[:-2].rstrip()
+        self._pending = self._pending[len(text):]
+        return text
+    
+    def flush(self) -> str:
+        """Return whatever is still held back once the stream has ended"""
+        if self._stage == "done":
+            text = ""
+        elif self._stage == "body":
+            text = self._pending.rstrip()
+        elif self._stage == "lang" and self._pending == "csv":
+            text = ""
+        else:
+            # No fence at all, or one cut off before its body: the whole remainder, as _clean_csv strips it
+            text = self._pending.strip()
+        self._pending = ""
+        self._stage = "done"
+        return text
+
+
+# The ```json block the agent appends to each reply, captured in a single scan
+_JSON_BLOCK_RE = re.compile(r"```json\s*(.*?)```", re.DOTALL)
+
+
+def _split_reply(response_text: str) -> tuple:
+    """Split an agent reply into the display text and the extracted_data it reports"""
+    extracted_data = {}
+    match = _JSON_BLOCK_RE.search(response_text)
+    try:
+        if match:
+            extracted = orjson.loads(match.group(1))
+            
+            if "extracted_data" in extracted:
+                extracted_data = extracted["extracted_data"]
+            
+            # Remove JSON block from response for cleaner display
+            response_text = response_text[:match.start()].strip()
+    except orjson.JSONDecodeError:
+        pass
+    
+    return response_text, extracted_data
+
+
+def _session_key(session_id: str) -> str:
+    return f"l1:session:{session_id}"
+
+
+async def get_session(session_id: str) -> Optional[Session]:
+    """Return a stored session, or None if it does not exist or has expired"""
+    if redis_client is None:
+        session = sessions.get(session_id)
+        if session is not None:
+            # Re-inserting restarts the session's TTL
+            sessions[session_id] = session
+        return session
+    blob = await redis_client.get(_session_key(session_id))
+    return Session.from_dict(orjson.loads(blob)) if blob is not None else None
 
-def get_or_create_session(session_id: Optional[str]) -> Session:
+
+async def delete_stored_session(session_id: str) -> bool:
+    """Remove a session from the store; returns whether it existed"""
+    if redis_client is not None:
+        return bool(await redis_client.delete(_session_key(session_id)))
+    session = sessions.pop(session_id, None)
+    if session is None:
+        return False
+    session._deleted = True
+    return True
+
+
+async def get_or_create_session(session_id: Optional[str]) -> Session:
     """Get existing session or create new one"""
-    if session_id and session_id in sessions:
-        return sessions[session_id]
+    if session_id:
+        session = await get_session(session_id)
+        if session is not None:
+            return session
     
     new_id = str(uuid.uuid4())
-    sessions[new_id] = Session(new_id)
-    return sessions[new_id]
+    session = Session(new_id)
+    await session.save()
+    return session
+
+
+async def expire_sessions():
+    """Periodically drop expired sessions so idle ones are freed even without new traffic"""
+    while True:
+        await asyncio.sleep(SESSION_EXPIRE_INTERVAL_SECONDS)
+        sessions.expire()
 
 
 @router.get("/")
@@ -283,7 +732,7 @@ async def chat(request: MessageRequest):
     - Includes checklist status and generation readiness
     """
     try:
-        session = get_or_create_session(request.session_id)
+        session = await get_or_create_session(request.session_id)
         response = await session.process_message(request.message)
         
         return MessageResponse(
@@ -305,11 +754,10 @@ async def generate_dataset(session_id: str):
     
     Requires all mandatory checklist items to be completed.
     """
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if not session.is_data_complete():
         raise HTTPException(
             status_code=400, 
@@ -328,6 +776,27 @@ async def generate_dataset(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/generate/{session_id}/stream")
+async def stream_generated_dataset(session_id: str):
+    """
+    Generate the complaint dataset for a session, streaming the CSV as it is produced.
+    
+    Requires all mandatory checklist items to be completed. The dataset is
+    stored on the session once the stream completes, as with /generate.
+    """
+    session = await get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if not session.is_data_complete():
+        raise HTTPException(
+            status_code=400, 
+            detail="Not all required information has been collected. Please complete the checklist first."
+        )
+    
+    return StreamingResponse(session.stream_dataset(), media_type="text/csv")
+
+
 @router.post("/regenerate/{session_id}")
 async def regenerate_dataset(session_id: str, request: RegenerateRequest):
     """
@@ -336,11 +805,10 @@ async def regenerate_dataset(session_id: str, request: RegenerateRequest):
     Takes the user's feedback on the previous dataset and generates
     a new version incorporating the feedback.
     """
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if not session.generated_dataset:
         raise HTTPException(status_code=400, detail="No dataset has been generated yet. Generate a dataset first.")
     
@@ -357,29 +825,59 @@ async def regenerate_dataset(session_id: str, request: RegenerateRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/regenerate_batch/{session_id}")
+async def regenerate_dataset_batch(session_id: str, request: RegenerateBatchRequest):
+    """
+    Regenerate several variants of the complaint dataset at once.
+    
+    Each feedback produces its own variant of the current dataset; the
+    variants are generated concurrently and all stored as iterations,
+    with the last one becoming the current dataset.
+    """
+    session = await get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if not session.generated_dataset:
+        raise HTTPException(status_code=400, detail="No dataset has been generated yet. Generate a dataset first.")
+    
+    if not 1 <= len(request.feedbacks) <= MAX_REGENERATE_VARIANTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {MAX_REGENERATE_VARIANTS} feedback entries"
+        )
+    
+    try:
+        datasets = await session.regenerate_batch(request.feedbacks)
+        return {
+            "success": True,
+            "message": f"Generated {len(datasets)} dataset variants based on feedback",
+            "datasets": datasets,
+            "iteration": session.current_iteration,
+            "feedback_count": len(session.feedback_history)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/download/{session_id}")
 async def download_dataset(session_id: str):
     """
     Download the generated dataset as a CSV file.
     """
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if session.generated_dataset is None:
         raise HTTPException(status_code=400, detail="No dataset has been generated yet")
     
-    # Create a streaming response with the CSV content
-    output = io.StringIO()
-    output.write(session.generated_dataset)
-    output.seek(0)
-    
-    industry = session.collected_data.get("industry", "domain").replace(" ", "_").lower()
+    industry = (session.collected_data.industry or "domain").replace(" ", "_").lower()
     filename = f"complaint_dataset_{industry}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     
-    return StreamingResponse(
-        iter([output.getvalue()]),
+    # The dataset is already one string in memory; send it as-is
+    return PlainTextResponse(
+        session.generated_dataset,
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -390,18 +888,17 @@ async def get_session_status(session_id: str):
     """
     Get the current status of a session including checklist and dataset availability.
     """
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     return {
         "session_id": session.session_id,
         "created_at": session.created_at.isoformat(),
         "checklist": session.get_checklist(),
         "is_ready_to_generate": session.is_data_complete(),
         "dataset_available": session.generated_dataset is not None,
-        "collected_data": session.collected_data
+        "collected_data": asdict(session.collected_data)
     }
 
 
@@ -410,8 +907,7 @@ async def delete_session(session_id: str):
     """
     Delete a session and all associated data.
     """
-    if session_id not in sessions:
+    if not await delete_stored_session(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    del sessions[session_id]
     return {"success": True, "message": "Session deleted"}
@@ -4,52 +4,62 @@ Layer 2 Prompts - Complaint Priority Classification
 This module contains prompts for analyzing complaints and classifying their priority.
 """
 
-import json
+import orjson
 
 
-def get_classification_prompt(complaint: str, risk_table: list, table8: list, table9: list, table10: list, table11: list) -> str:
-    """
-    Generate a prompt for classifying a single complaint.
-    
-    Args:
-        complaint: The complaint text to analyze
-        risk_table: The risk classification table (output from Layer 1)
-        table8: Impact scale
-        table9: Urgency scale
-        table10: Frequency scale
-        table11: Controllability scale
-        
-    Returns:
-        Formatted classification prompt string
-    """
-    risk_table_str = json.dumps(risk_table, indent=2)
-    table8_str = json.dumps(table8, indent=2)
-    table9_str = json.dumps(table9, indent=2)
-    table10_str = json.dumps(table10, indent=2)
-    table11_str = json.dumps(table11, indent=2)
-    
-    return f"""You are a complaint priority classification system. Analyze the following complaint and classify it according to the reference tables provided.
+# Serialized reference tables, keyed by id() of the loaded table.
+# The tables are immutable (header, rows) tuples loaded once at startup, so each is dumped only once.
+_serialized_tables = {}
 
-## Complaint to Analyze:
-"{complaint}"
+# Rendered static prompt blocks, keyed by id() of the template and of each table.
+# _serialized_tables keeps the tables alive, so their ids are never reused.
+_rendered_blocks = {}
+
+
+def _dump_table(table: tuple) -> str:
+    """Return the indented JSON (a list of row objects) for a static reference table, serializing it on first use"""
+    cached = _serialized_tables.get(id(table))
+    if cached is None or cached[0] is not table:
+        header, rows = table
+        records = [dict(zip(header, row)) for row in rows]
+        cached = (table, orjson.dumps(records, option=orjson.OPT_INDENT_2).decode())
+        _serialized_tables[id(table)] = cached
+    return cached[1]
+
+
+def _render_static(template: str, **tables: tuple) -> str:
+    """Fill a template whose only placeholders are reference tables, once per table set"""
+    key = (id(template), *(id(table) for table in tables.values()))
+    rendered = _rendered_blocks.get(key)
+    if rendered is None:
+        rendered = template.format(**{name: _dump_table(table) for name, table in tables.items()})
+        _rendered_blocks[key] = rendered
+    return rendered
+
+
+_CLASSIFICATION_HEAD = """You are a complaint priority classification system. Analyze the complaint given at the end of this prompt and classify it according to the reference tables provided.
 
 ## Risk Classification Table (from business context):
-{risk_table_str}
+"""
+
+_SCORING_SCALES = """
 
 ## Scoring Scales:
 
 ### Impact Scale (Table 8):
-{table8_str}
+{table8}
 
 ### Urgency Scale (Table 9):
-{table9_str}
+{table9}
 
 ### Frequency Scale (Table 10):
-{table10_str}
+{table10}
 
 ### Controllability Scale (Table 11):
-{table11_str}
+{table11}
+"""
 
+_CLASSIFICATION_TASK = """
 ## Task:
 1. Identify which risk code from the Risk Classification Table best matches this complaint
 2. Assign scores (1-5) for each dimension based on the complaint content:
@@ -60,14 +70,14 @@ def get_classification_prompt(complaint: str, risk_table: list, table8: list, ta
 
 ## Response Format:
 Respond with ONLY a JSON object in this exact format (no markdown, no explanation):
-{{
+{
     "risk_code": "XX-00",
     "risk_description": "Brief description from the risk table",
     "impact_score": 0,
     "urgency_score": 0,
     "frequency_score": 0,
     "controllability_score": 0
-}}
+}
 
 Important:
 - All scores must be integers from 1 to 5
@@ -75,5 +85,99 @@ Important:
 - risk_description should be the Description from the matching risk code row
 """
 
+_BATCH_CLASSIFICATION_HEAD = """You are a complaint priority classification system. Analyze each of the numbered complaints given at the end of this prompt independently and classify it according to the reference tables provided.
+
+## Risk Classification Table (from business context):
+"""
+
+_BATCH_CLASSIFICATION_TASK = """
+## Task:
+For EACH numbered complaint:
+1. Identify which risk code from the Risk Classification Table best matches the complaint
+2. Assign scores (1-5) for each dimension based on the complaint content:
+   - Impact: How severely does this affect the business/customer?
+   - Urgency: How quickly does this need to be addressed?
+   - Frequency: How often might this type of complaint occur?
+   - Controllability: How much control does the organization have to resolve this?
+
+## Response Format:
+Respond with ONLY a JSON array containing one object per complaint, in this exact format (no markdown, no explanation):
+[
+    {
+        "index": 1,
+        "risk_code": "XX-00",
+        "risk_description": "Brief description from the risk table",
+        "impact_score": 0,
+        "urgency_score": 0,
+        "frequency_score": 0,
+        "controllability_score": 0
+    }
+]
+
+Important:
+- Include exactly one object for every complaint, with "index" set to the complaint's number
+- All scores must be integers from 1 to 5
+- risk_code must match one from the Risk Classification Table
+- risk_description should be the Description from the matching risk code row
+"""
+
+
+def build_prefix(risk_table: list, table8: tuple, table9: tuple, table10: tuple, table11: tuple) -> str:
+    """
+    Build the complaint-independent part of the classification prompt.
+    
+    Only depends on the session's tables, so it is built once per session and
+    each complaint just appends build_suffix(complaint).
+    
+    Args:
+        risk_table: The risk classification table (output from Layer 1)
+        table8: Impact scale (header, rows)
+        table9: Urgency scale (header, rows)
+        table10: Frequency scale (header, rows)
+        table11: Controllability scale (header, rows)
+        
+    Returns:
+        Classification prompt prefix string
+    """
+    return (
+        _CLASSIFICATION_HEAD
+        + orjson.dumps(risk_table, option=orjson.OPT_INDENT_2).decode()
+        + _render_static(_SCORING_SCALES, table8=table8, table9=table9, table10=table10, table11=table11)
+        + _CLASSIFICATION_TASK
+    )
+
+
+def build_suffix(complaint: str) -> str:
+    """Build the per-complaint tail of the classification prompt"""
+    return f'\n## Complaint to Analyze:\n"{complaint}"\n'
+
+
+def build_batch_prefix(risk_table: list, table8: tuple, table9: tuple, table10: tuple, table11: tuple) -> str:
+    """
+    Build the complaint-independent part of the batch classification prompt.
+    
+    Args:
+        risk_table: The risk classification table (output from Layer 1)
+        table8: Impact scale (header, rows)
+        table9: Urgency scale (header, rows)
+        table10: Frequency scale (header, rows)
+        table11: Controllability scale (header, rows)
+        
+    Returns:
+        Batch classification prompt prefix string
+    """
+    return (
+        _BATCH_CLASSIFICATION_HEAD
+        + orjson.dumps(risk_table, option=orjson.OPT_INDENT_2).decode()
+        + _render_static(_SCORING_SCALES, table8=table8, table9=table9, table10=table10, table11=table11)
+        + _BATCH_CLASSIFICATION_TASK
+    )
+
+
+def build_batch_suffix(complaints: list) -> str:
+    """Build the tail of the batch classification prompt, numbering complaints from 1"""
+    numbered = "\n".join(f'{i}. "{complaint}"' for i, complaint in enumerate(complaints, 1))
+    return f"\n## Complaints to Analyze:\n{numbered}\n"
+
 
 SYSTEM_PROMPT = """You are a complaint classification AI. You analyze customer complaints and classify them according to risk categories and priority scoring dimensions. Always respond with valid JSON only."""
@@ -14,13 +14,21 @@ Priority Levels:
 """
 
 import os
+import sys
 import io
 import csv
-import json
+import codecs
+import itertools
+import re
 import uuid
 import hashlib
 import asyncio
+import gc
+import bisect
+import operator
 from typing import Optional
+from collections import Counter
+from dataclasses import dataclass, replace
 from datetime import datetime
 from pathlib import Path
 
@@ -28,9 +36,15 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from aiolimiter import AsyncLimiter
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
+import orjson
+import redis.asyncio as redis
+from cachetools import LRUCache
 from dotenv import load_dotenv
 
-from .prompts import get_classification_prompt, SYSTEM_PROMPT
+from .prompts import build_prefix, build_suffix, build_batch_prefix, build_batch_suffix, SYSTEM_PROMPT
 
 # Load environment variables
 ROOT_DIR = Path(__file__).resolve().parent.parent.parent.parent
@@ -39,22 +53,134 @@ load_dotenv(ROOT_DIR / ".env")
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# The model client is stateless apart from its configuration, so every session shares one
+MODEL = genai.GenerativeModel("gemini-2.5-flash")
+
 # Data directory for reference tables
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 
 # Create router for Layer 2
 router = APIRouter()
 
-# In-memory storage for sessions and cache
+# Maximum number of in-flight Gemini requests per processing session
+L2_CONCURRENCY = int(os.getenv("L2_CONCURRENCY", "16"))
+
+# Gemini requests per minute across all sessions in this process, matching the API quota
+L2_QPM = int(os.getenv("L2_QPM", "500"))
+llm_limiter = AsyncLimiter(L2_QPM, 60)
+
+# Sessions with at least this many complaints classify L2_BATCH_SIZE complaints per request
+L2_BATCH_THRESHOLD = int(os.getenv("L2_BATCH_THRESHOLD", "50"))
+L2_BATCH_SIZE = int(os.getenv("L2_BATCH_SIZE", "20"))
+
+# Sessions and classifications live in Redis when REDIS_URL is set, so several
+# workers can share them; otherwise they are kept in this process's memory
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = redis.from_url(REDIS_URL) if REDIS_URL else None
+SESSION_TTL_SECONDS = 24 * 60 * 60
+SESSION_REAP_INTERVAL_SECONDS = 300
+# Sessions with more complaints than this trigger a full garbage collection when they finish
+GC_AFTER_ROWS = 1000
+CLASSIFICATION_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Seconds between progress-stream events when nothing changes / when following another worker
+PROGRESS_STREAM_HEARTBEAT = 15
+PROGRESS_STREAM_POLL_INTERVAL = 1
+
+# Live session objects owned by this process (all sessions when Redis is not used)
 sessions = {}
-classification_cache = {}  # Cache for complaint classifications
+# Classifications shared across sessions with the same risk table, used when Redis is not;
+# least recently used entries are evicted so a long-lived process stays bounded
+classification_cache = LRUCache(maxsize=int(os.getenv("L2_CACHE_SIZE", "10000")))
+# Classification cache lookups served / missed since startup or the last clear
+cache_counters = {"hits": 0, "misses": 0}
+
+# Opening ``` / ```json fence and closing ``` fence around an LLM reply
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def _strip_fence(text: str) -> str:
+    """Remove a markdown code fence wrapped around an LLM reply"""
+    return _FENCE_RE.sub("", text).strip()
+
+
+_SCORE_FIELDS = ("impact_score", "urgency_score", "frequency_score", "controllability_score")
+
+
+def _clamp_scores(result: dict) -> dict:
+    """Ensure all scores are integers 1-5, using the midpoint 3 for missing or non-numeric values"""
+    for field in _SCORE_FIELDS:
+        try:
+            value = int(result.get(field, 3))
+        except (TypeError, ValueError):
+            value = 3
+        result[field] = 1 if value < 1 else 5 if value > 5 else value
+    return result
+
+
+def _parse_llm_json(text: str) -> dict:
+    """Parse a single classification reply into a dict with scores clamped to 1-5"""
+    result = orjson.loads(_strip_fence(text))
+    # An incomplete reply must fail here, before it is cached, rather than in build_result
+    if not isinstance(result, dict) or "risk_code" not in result or "risk_description" not in result:
+        raise ValueError("Classification reply is missing risk_code or risk_description")
+    return _clamp_scores(result)
+
+
+def _unclassified() -> dict:
+    """Default classification for a complaint the LLM could not classify; never cached"""
+    return {
+        "risk_code": "ER-03",
+        "risk_description": "Unable to classify",
+        "impact_score": 3,
+        "urgency_score": 3,
+        "frequency_score": 3,
+        "controllability_score": 3
+    }
+
+
+# Lower bounds of P3, P2 and P1; a score on a bound belongs to the higher level
+_PRIORITY_THRESHOLDS = (20, 40, 60)
+_PRIORITY_LEVELS = ("P4 - Low", "P3 - Medium", "P2 - High", "P1 - Critical")
+
+# Gemini errors worth retrying: rate limiting, overload and timeouts
+_TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError
+)
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(multiplier=0.5, max=20),
+    retry=retry_if_exception_type(_TRANSIENT_ERRORS),
+    reraise=True
+)
+async def _call_llm(prompt: str) -> str:
+    """Send a prompt to Gemini, retrying transient errors with jittered exponential backoff"""
+    async with llm_limiter:
+        response = await MODEL.generate_content_async(prompt)
+    return response.text
+
+
+async def _run_all(coros) -> list:
+    """Like asyncio.gather, but the first failure cancels the rest and is raised on its own"""
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(coro) for coro in coros]
+    except ExceptionGroup as errors:
+        raise errors.exceptions[0]
+    return [task.result() for task in tasks]
 
 
-def load_csv_table(filename: str) -> list:
-    """Load a CSV table from the data directory"""
+def load_csv_table(filename: str) -> tuple:
+    """Load a CSV table from the data directory as an immutable (header, rows) pair of interned strings"""
     with open(DATA_DIR / filename, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+        reader = csv.reader(f)
+        header = tuple(sys.intern(name) for name in next(reader))
+        return header, tuple(tuple(sys.intern(cell) for cell in row) for row in reader)
 
 
 # Load reference tables
@@ -64,6 +190,20 @@ TABLE10 = load_csv_table("table10_frequency_scale.csv")
 TABLE11 = load_csv_table("table11_controllability_scale.csv")
 
 
+@dataclass(slots=True, frozen=True)
+class ResultRow:
+    """One classified complaint; rows for repeated complaints share the same instance"""
+    complaint: str
+    risk_code: str
+    risk_description: str
+    impact_score: int
+    urgency_score: int
+    frequency_score: int
+    controllability_score: int
+    priority_score: float
+    priority_level: str
+
+
 class ProcessingSession:
     """Manages a complaint processing session"""
     
@@ -71,7 +211,11 @@ class ProcessingSession:
         self.session_id = session_id
         self.created_at = datetime.now()
         self.complaints = []
-        self.risk_table = []
+        self._risk_table = []
+        self._risk_digest = None
+        self._cache: dict[str, dict] = {}  # Classifications keyed by complaint text
+        self._prompt_prefix = None
+        self._batch_prompt_prefix = None
         self.results = []
         self.status = "pending"  # pending, processing, completed, error
         self.total_rows = 0
@@ -79,7 +223,9 @@ class ProcessingSession:
         self.start_time = None
         self.end_time = None
         self.error_message = None
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+        self._progress_version = 0  # Bumped on every progress change
+        self._progress_changed = asyncio.Condition()
+        self._deleted = False  # Set once removed from the store; saves then do nothing
     
     def get_progress(self) -> dict:
         """Get current processing progress"""
@@ -96,120 +242,284 @@ class ProcessingSession:
             "error_message": self.error_message
         }
     
-    def get_cache_key(self, complaint: str) -> str:
-        """Generate a cache key for a complaint"""
-        # Include risk table hash to invalidate cache when table changes
-        risk_table_str = json.dumps(self.risk_table, sort_keys=True)
-        combined = f"{complaint}|{risk_table_str}"
-        return hashlib.md5(combined.encode()).hexdigest()
+    @property
+    def risk_table(self) -> list:
+        return self._risk_table
+    
+    @risk_table.setter
+    def risk_table(self, value: list):
+        # Cached classifications are only valid for the table they were made with
+        self._risk_table = value
+        self._risk_digest = None
+        self._cache.clear()
+        self._prompt_prefix = None
+        self._batch_prompt_prefix = None
+    
+    @property
+    def risk_digest(self) -> str:
+        """Digest of the risk table, computed once per table; scopes the shared classification cache"""
+        if self._risk_digest is None:
+            risk_table_bytes = orjson.dumps(self._risk_table, option=orjson.OPT_SORT_KEYS)
+            self._risk_digest = hashlib.blake2b(risk_table_bytes, digest_size=16).hexdigest()
+        return self._risk_digest
+    
+    def shared_cache_key(self, complaint: str) -> str:
+        """Key of a complaint in the cross-session classification cache"""
+        complaint_hash = hashlib.blake2b(complaint.encode(), digest_size=16).hexdigest()
+        return f"l2:cls:{self.risk_digest}:{complaint_hash}"
+    
+    async def get_cached(self, complaint: str) -> Optional[dict]:
+        """Look a classification up in the session cache, then in the shared cache"""
+        result = self._cache.get(complaint)
+        if result is None:
+            key = self.shared_cache_key(complaint)
+            if redis_client is not None:
+                blob = await redis_client.get(key)
+                result = orjson.loads(blob) if blob is not None else None
+            else:
+                result = classification_cache.get(key)
+            if result is not None:
+                self._cache[complaint] = result
+        cache_counters["hits" if result is not None else "misses"] += 1
+        return result
+    
+    async def set_cached(self, complaint: str, result: dict):
+        """Store a classification in the session cache and the shared cache"""
+        self._cache[complaint] = result
+        key = self.shared_cache_key(complaint)
+        if redis_client is not None:
+            await redis_client.set(key, orjson.dumps(result), ex=CLASSIFICATION_TTL_SECONDS)
+        else:
+            classification_cache[key] = result
+    
+    def to_dict(self) -> dict:
+        """Serialize the session state (not caches) for the shared store"""
+        return {
+            "session_id": self.session_id,
+            "created_at": self.created_at.isoformat(),
+            "complaints": self.complaints,
+            "risk_table": self._risk_table,
+            "results": self.results,
+            "status": self.status,
+            "total_rows": self.total_rows,
+            "processed_rows": self.processed_rows,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "error_message": self.error_message
+        }
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "ProcessingSession":
+        """Rebuild a session from to_dict() output"""
+        session = cls(data["session_id"])
+        session.created_at = datetime.fromisoformat(data["created_at"])
+        session.complaints = data["complaints"]
+        session.risk_table = data["risk_table"]
+        session.results = [ResultRow(**row) for row in data["results"]]
+        session.status = data["status"]
+        session.total_rows = data["total_rows"]
+        session.processed_rows = data["processed_rows"]
+        session.start_time = datetime.fromisoformat(data["start_time"]) if data["start_time"] else None
+        session.end_time = datetime.fromisoformat(data["end_time"]) if data["end_time"] else None
+        session.error_message = data["error_message"]
+        return session
+    
+    async def notify_progress(self):
+        """Wake every progress stream waiting on this session"""
+        async with self._progress_changed:
+            self._progress_version += 1
+            self._progress_changed.notify_all()
+    
+    async def save(self):
+        """Persist the full session state"""
+        await self.notify_progress()
+        if self._deleted:
+            # A run still going on a deleted session must not bring it back
+            return
+        if redis_client is None:
+            sessions[self.session_id] = self
+            return
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(_session_key(self.session_id), orjson.dumps(self.to_dict()), ex=SESSION_TTL_SECONDS)
+            pipe.set(_progress_key(self.session_id), self.progress_record(), ex=SESSION_TTL_SECONDS)
+            await pipe.execute()
+        if self.status != "processing":
+            # Other workers read the stored copy; only keep the live object while this process runs it
+            sessions.pop(self.session_id, None)
+    
+    async def save_progress(self):
+        """Persist just the progress record, so progress polls on other workers stay current"""
+        await self.notify_progress()
+        if redis_client is not None and not self._deleted:
+            await redis_client.set(_progress_key(self.session_id), self.progress_record(), ex=SESSION_TTL_SECONDS)
+    
+    def progress_record(self) -> bytes:
+        """get_progress() plus the start time, small enough to poll instead of the full session"""
+        return orjson.dumps({
+            **self.get_progress(),
+            "start_time": self.start_time.isoformat() if self.start_time else None
+        })
+    
+    @property
+    def prompt_prefix(self) -> str:
+        """Static part of the classification prompt, built once per risk table"""
+        if self._prompt_prefix is None:
+            self._prompt_prefix = build_prefix(self._risk_table, TABLE8, TABLE9, TABLE10, TABLE11)
+        return self._prompt_prefix
+    
+    @property
+    def batch_prompt_prefix(self) -> str:
+        """Static part of the batch classification prompt, built once per risk table"""
+        if self._batch_prompt_prefix is None:
+            self._batch_prompt_prefix = build_batch_prefix(self._risk_table, TABLE8, TABLE9, TABLE10, TABLE11)
+        return self._batch_prompt_prefix
     
     async def classify_complaint(self, complaint: str) -> dict:
         """Classify a single complaint using LLM with caching"""
-        cache_key = self.get_cache_key(complaint)
-        
         # Check cache first
-        if cache_key in classification_cache:
-            return classification_cache[cache_key]
-        
+        cached = await self.get_cached(complaint)
+        if cached is not None:
+            return cached
+        return await self._classify_uncached(complaint)
+    
+    async def _classify_uncached(self, complaint: str) -> dict:
+        """Classify a single complaint with the LLM and cache the result, without looking the cache up first"""
         # Generate classification using LLM
-        prompt = get_classification_prompt(
-            complaint, 
-            self.risk_table, 
-            TABLE8, TABLE9, TABLE10, TABLE11
-        )
+        prompt = self.prompt_prefix + build_suffix(complaint)
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean up response if wrapped in markdown
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            result = json.loads(response_text)
-            
-            # Validate and ensure all scores are integers 1-5
-            result["impact_score"] = max(1, min(5, int(result.get("impact_score", 3))))
-            result["urgency_score"] = max(1, min(5, int(result.get("urgency_score", 3))))
-            result["frequency_score"] = max(1, min(5, int(result.get("frequency_score", 3))))
-            result["controllability_score"] = max(1, min(5, int(result.get("controllability_score", 3))))
+            result = _parse_llm_json(await _call_llm(prompt))
             
             # Cache the result
-            classification_cache[cache_key] = result
+            await self.set_cached(complaint, result)
             
             return result
             
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            # Return default values on error
-            return {
-                "risk_code": "ER-03",
-                "risk_description": "Unable to classify",
-                "impact_score": 3,
-                "urgency_score": 3,
-                "frequency_score": 3,
-                "controllability_score": 3
-            }
+        except (orjson.JSONDecodeError, KeyError, ValueError, *_TRANSIENT_ERRORS) as e:
+            # Return default values on error, or once retries are exhausted
+            return _unclassified()
+    
+    async def classify_batch(self, complaints: list, semaphore: asyncio.Semaphore) -> list:
+        """Classify several complaints with a single LLM request, falling back per complaint.
+        
+        Every LLM request, including each fallback, holds one semaphore slot.
+        """
+        results = await asyncio.gather(*(self.get_cached(c) for c in complaints))
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        if pending:
+            prompt = self.batch_prompt_prefix + build_batch_suffix([complaints[i] for i in pending])
+            
+            try:
+                async with semaphore:
+                    text = await _call_llm(prompt)
+                
+                for item in orjson.loads(_strip_fence(text)):
+                    try:
+                        position = int(item["index"]) - 1
+                        if not 0 <= position < len(pending):
+                            continue
+                        result = _clamp_scores({
+                            "risk_code": item["risk_code"],
+                            "risk_description": item["risk_description"],
+                            **{field: item.get(field, 3) for field in _SCORE_FIELDS}
+                        })
+                    except (KeyError, ValueError, TypeError):
+                        continue
+                    i = pending[position]
+                    results[i] = result
+                    await self.set_cached(complaints[i], result)
+            except _TRANSIENT_ERRORS:
+                # Retries are exhausted, so the quota or service is down: splitting the chunk would only add load
+                for i in pending:
+                    results[i] = _unclassified()
+            except (orjson.JSONDecodeError, ValueError, TypeError):
+                pass
+        
+        # Anything the batch response missed or garbled is classified on its own
+        missing = [i for i in pending if results[i] is None]
+        if missing:
+            async def classify_one(complaint: str) -> dict:
+                # Already looked up (and counted as a miss) above
+                async with semaphore:
+                    return await self._classify_uncached(complaint)
+            
+            retried = await asyncio.gather(*(classify_one(complaints[i]) for i in missing))
+            for i, result in zip(missing, retried):
+                results[i] = result
+        
+        return results
     
     def calculate_priority(self, impact: int, urgency: int, frequency: int, controllability: int) -> tuple:
         """Calculate priority score and level"""
-        # PS = (Impact × Urgency × Frequency) / Controllability
+        # PS = (Impact × Urgency × Frequency) / Controllability, left unrounded until emitted
         priority_score = (impact * urgency * frequency) / controllability
-        priority_score = round(priority_score, 2)
-        
-        # Determine priority level
-        if priority_score >= 60:
-            priority_level = "P1 - Critical"
-        elif priority_score >= 40:
-            priority_level = "P2 - High"
-        elif priority_score >= 20:
-            priority_level = "P3 - Medium"
-        else:
-            priority_level = "P4 - Low"
+        return priority_score, _PRIORITY_LEVELS[bisect.bisect_right(_PRIORITY_THRESHOLDS, priority_score)]
+    
+    def build_result(self, complaint: str, classification: dict) -> ResultRow:
+        """Build a result row from a complaint and its classification"""
+        priority_score, priority_level = self.calculate_priority(
+            classification["impact_score"],
+            classification["urgency_score"],
+            classification["frequency_score"],
+            classification["controllability_score"]
+        )
         
-        return priority_score, priority_level
+        return ResultRow(
+            complaint=complaint,
+            risk_code=classification["risk_code"],
+            risk_description=classification["risk_description"],
+            impact_score=classification["impact_score"],
+            urgency_score=classification["urgency_score"],
+            frequency_score=classification["frequency_score"],
+            controllability_score=classification["controllability_score"],
+            priority_score=priority_score,
+            priority_level=priority_level
+        )
     
     async def process_complaints(self):
         """Process all complaints in the session"""
         self.status = "processing"
         self.start_time = datetime.now()
+        self.end_time = None
         self.results = []
+        self.processed_rows = 0
+        await self.save()
         
-        try:
-            for i, complaint in enumerate(self.complaints):
-                # Classify the complaint
+        # Identical complaints are classified once; progress still counts every row
+        row_counts = Counter(self.complaints)
+        unique = list(row_counts)
+        
+        # Requests overlap up to L2_CONCURRENCY; the semaphore replaces the old per-item sleep
+        semaphore = asyncio.Semaphore(L2_CONCURRENCY)
+        
+        async def process_one(complaint: str) -> dict:
+            async with semaphore:
                 classification = await self.classify_complaint(complaint)
-                
-                # Calculate priority
-                priority_score, priority_level = self.calculate_priority(
-                    classification["impact_score"],
-                    classification["urgency_score"],
-                    classification["frequency_score"],
-                    classification["controllability_score"]
-                )
-                
-                # Build result row
-                result = {
-                    "complaint": complaint,
-                    "risk_code": classification["risk_code"],
-                    "risk_description": classification["risk_description"],
-                    "impact_score": classification["impact_score"],
-                    "urgency_score": classification["urgency_score"],
-                    "frequency_score": classification["frequency_score"],
-                    "controllability_score": classification["controllability_score"],
-                    "priority_score": priority_score,
-                    "priority_level": priority_level
-                }
-                
-                self.results.append(result)
-                self.processed_rows = i + 1
-                
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.1)
+            self.processed_rows += row_counts[complaint]
+            await self.save_progress()
+            return classification
+        
+        async def process_chunk(chunk: list) -> list:
+            classifications = await self.classify_batch(chunk, semaphore)
+            self.processed_rows += sum(row_counts[c] for c in chunk)
+            await self.save_progress()
+            return classifications
+        
+        try:
+            if len(unique) >= L2_BATCH_THRESHOLD:
+                # Large sessions: one request per chunk instead of one per complaint
+                chunks = [
+                    unique[i:i + L2_BATCH_SIZE]
+                    for i in range(0, len(unique), L2_BATCH_SIZE)
+                ]
+                chunk_results = await _run_all(process_chunk(c) for c in chunks)
+                classifications = [cls for chunk in chunk_results for cls in chunk]
+            else:
+                classifications = await _run_all(process_one(c) for c in unique)
+            
+            rows = {c: self.build_result(c, cls) for c, cls in zip(unique, classifications)}
+            self.results = [rows[c] for c in self.complaints]
             
             self.status = "completed"
             self.end_time = datetime.now()
@@ -218,90 +528,49 @@ class ProcessingSession:
             self.status = "error"
             self.error_message = str(e)
             self.end_time = datetime.now()
+        
+        await self.save()
+        
+        if len(self.complaints) > GC_AFTER_ROWS:
+            # Hand the per-run temporaries of a large session back promptly
+            gc.collect()
     
     async def reprocess_with_feedback(self, feedback: str):
         """Reprocess complaints with user feedback guidance"""
         self.status = "processing"
         self.start_time = datetime.now()
+        self.end_time = None
         self.results = []
+        self.processed_rows = 0
+        await self.save()
         
         # Build feedback context for the prompt
         feedback_context = f"\nUser Feedback: {feedback}\n"
         feedback_context += "Please use this feedback to adjust your scoring and classifications when re-analyzing the complaints."
         
+        # Clear cached classifications so every complaint gets reclassified
+        self._cache.clear()
+        prompt_prefix = self.prompt_prefix
+        
+        semaphore = asyncio.Semaphore(L2_CONCURRENCY)
+        
+        async def reprocess_one(complaint: str) -> dict:
+            # Generate classification using LLM with feedback
+            prompt = prompt_prefix + build_suffix(complaint) + feedback_context
+            
+            try:
+                async with semaphore:
+                    text = await _call_llm(prompt)
+                result = _parse_llm_json(text)
+            except (orjson.JSONDecodeError, KeyError, ValueError, *_TRANSIENT_ERRORS) as e:
+                result = _unclassified()
+            
+            self.processed_rows += 1
+            await self.save_progress()
+            return self.build_result(complaint, result)
+        
         try:
-            for i, complaint in enumerate(self.complaints):
-                # Classify with feedback context
-                cache_key = self.get_cache_key(complaint)
-                
-                # Clear cache for this complaint so it gets reclassified
-                if cache_key in classification_cache:
-                    del classification_cache[cache_key]
-                
-                # Generate classification using LLM with feedback
-                prompt = get_classification_prompt(
-                    complaint, 
-                    self.risk_table, 
-                    TABLE8, TABLE9, TABLE10, TABLE11
-                ) + feedback_context
-                
-                try:
-                    response = self.model.generate_content(prompt)
-                    response_text = response.text.strip()
-                    
-                    # Clean up response if wrapped in markdown
-                    if response_text.startswith("```json"):
-                        response_text = response_text[7:]
-                    if response_text.startswith("```"):
-                        response_text = response_text[3:]
-                    if response_text.endswith("```"):
-                        response_text = response_text[:-3]
-                    response_text = response_text.strip()
-                    
-                    result = json.loads(response_text)
-                    
-                    # Validate and ensure all scores are integers 1-5
-                    result["impact_score"] = max(1, min(5, int(result.get("impact_score", 3))))
-                    result["urgency_score"] = max(1, min(5, int(result.get("urgency_score", 3))))
-                    result["frequency_score"] = max(1, min(5, int(result.get("frequency_score", 3))))
-                    result["controllability_score"] = max(1, min(5, int(result.get("controllability_score", 3))))
-                    
-                except (json.JSONDecodeError, KeyError, ValueError) as e:
-                    result = {
-                        "risk_code": "ER-03",
-                        "risk_description": "Unable to classify",
-                        "impact_score": 3,
-                        "urgency_score": 3,
-                        "frequency_score": 3,
-                        "controllability_score": 3
-                    }
-                
-                # Calculate priority
-                priority_score, priority_level = self.calculate_priority(
-                    result["impact_score"],
-                    result["urgency_score"],
-                    result["frequency_score"],
-                    result["controllability_score"]
-                )
-                
-                # Build result row
-                result_row = {
-                    "complaint": complaint,
-                    "risk_code": result["risk_code"],
-                    "risk_description": result["risk_description"],
-                    "impact_score": result["impact_score"],
-                    "urgency_score": result["urgency_score"],
-                    "frequency_score": result["frequency_score"],
-                    "controllability_score": result["controllability_score"],
-                    "priority_score": priority_score,
-                    "priority_level": priority_level
-                }
-                
-                self.results.append(result_row)
-                self.processed_rows = i + 1
-                
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.1)
+            self.results = await _run_all(reprocess_one(c) for c in self.complaints)
             
             self.status = "completed"
             self.end_time = datetime.now()
@@ -310,6 +579,101 @@ class ProcessingSession:
             self.status = "error"
             self.error_message = str(e)
             self.end_time = datetime.now()
+        
+        await self.save()
+
+
+def _session_key(session_id: str) -> str:
+    return f"l2:session:{session_id}"
+
+
+def _progress_key(session_id: str) -> str:
+    # Holds progress_record() JSON; l2:progress: held the bare row counter
+    return f"l2:progress:v2:{session_id}"
+
+
+async def get_session(session_id: str) -> Optional[ProcessingSession]:
+    """Return the live session if this process owns it, else the stored copy"""
+    session = sessions.get(session_id)
+    if session is not None:
+        return session
+    if redis_client is None:
+        return None
+    blob, progress = await redis_client.mget(_session_key(session_id), _progress_key(session_id))
+    if blob is None:
+        return None
+    session = ProcessingSession.from_dict(orjson.loads(blob))
+    if session.status == "processing" and progress is not None:
+        session.processed_rows = orjson.loads(progress)["processed_rows"]
+    return session
+
+
+async def get_session_progress(session_id: str) -> Optional[dict]:
+    """Return get_progress() of a session without loading the stored copy's complaints and results"""
+    session = sessions.get(session_id)
+    if session is not None:
+        return session.get_progress()
+    if redis_client is None:
+        return None
+    blob = await redis_client.get(_progress_key(session_id))
+    if blob is None:
+        # Stored before progress records existed
+        session = await get_session(session_id)
+        return session.get_progress() if session is not None else None
+    progress = orjson.loads(blob)
+    start_time = progress.pop("start_time")
+    if progress["status"] == "processing" and start_time:
+        # Still running on another worker: the stored elapsed time is as old as the last update
+        elapsed = (datetime.now() - datetime.fromisoformat(start_time)).total_seconds()
+        progress["elapsed_seconds"] = round(elapsed, 1)
+    return progress
+
+
+async def delete_stored_session(session_id: str) -> bool:
+    """Remove a session everywhere it is stored; returns whether it existed"""
+    session = sessions.pop(session_id, None)
+    existed = session is not None
+    if existed:
+        session._deleted = True
+    if redis_client is not None:
+        existed = bool(await redis_client.delete(_session_key(session_id), _progress_key(session_id))) or existed
+    return existed
+
+
+async def reap_sessions():
+    """Periodically drop local sessions that finished (or were left pending) more than SESSION_TTL_SECONDS ago"""
+    while True:
+        await asyncio.sleep(SESSION_REAP_INTERVAL_SECONDS)
+        now = datetime.now()
+        expired = [
+            session_id for session_id, session in sessions.items()
+            if session.status != "processing"
+            and (now - (session.end_time or session.created_at)).total_seconds() > SESSION_TTL_SECONDS
+        ]
+        for session_id in expired:
+            del sessions[session_id]
+
+
+async def _count_keys(pattern: str) -> int:
+    count = 0
+    async for _ in redis_client.scan_iter(match=pattern, count=1000):
+        count += 1
+    return count
+
+
+# Common complaint-column header names, matched as substrings in a single regex pass
+_HEADER_KEYWORDS = frozenset({
+    "complaint", "text", "message", "review", "comment",
+    "feedback", "description", "content", "negative", "issue",
+    "problem", "concern", "note", "remark", "observation"
+})
+_HEADER_KEYWORD_RE = re.compile("|".join(sorted(_HEADER_KEYWORDS)))
+_DIGITS = str.maketrans("", "", "0123456789")
+
+
+def _looks_like_header(first_row: str) -> bool:
+    """A lowercased first cell is a header if it contains a header keyword or is a short label without digits"""
+    return bool(_HEADER_KEYWORD_RE.search(first_row)) or (len(first_row) < 30 and first_row == first_row.translate(_DIGITS))
 
 
 # Pydantic models
@@ -358,37 +722,28 @@ async def upload_files(
     session = ProcessingSession(session_id)
     
     try:
-        # Parse complaints CSV
-        complaints_content = await complaints_file.read()
-        complaints_text = complaints_content.decode("utf-8")
-        complaints_reader = csv.reader(io.StringIO(complaints_text))
+        # Parse complaints CSV, decoding and reading rows straight from the upload stream
+        complaints_reader = csv.reader(codecs.iterdecode(complaints_file.file, "utf-8"))
         
         # Skip header if present and extract complaints
-        rows = list(complaints_reader)
-        if rows:
+        first = next(complaints_reader, None)
+        if first is not None:
             # Check if first row looks like a header (common header names)
-            first_row = rows[0][0].lower().strip() if rows[0] else ""
-            header_keywords = [
-                "complaint", "text", "message", "review", "comment", 
-                "feedback", "description", "content", "negative", "issue",
-                "problem", "concern", "note", "remark", "observation"
-            ]
-            # Skip first row if it contains any header keyword or is very short (likely a label)
-            if any(keyword in first_row for keyword in header_keywords) or (len(first_row) < 30 and not any(c.isdigit() for c in first_row)):
-                rows = rows[1:]
+            first_row = first[0].lower().strip() if first else ""
+            rows = complaints_reader
+            if not _looks_like_header(first_row):
+                rows = itertools.chain([first], complaints_reader)
             
             session.complaints = [row[0].strip() for row in rows if row and row[0].strip()]
         
         session.total_rows = len(session.complaints)
         
         # Parse risk table CSV
-        risk_content = await risk_table_file.read()
-        risk_text = risk_content.decode("utf-8")
-        risk_reader = csv.DictReader(io.StringIO(risk_text))
+        risk_reader = csv.DictReader(codecs.iterdecode(risk_table_file.file, "utf-8"))
         session.risk_table = list(risk_reader)
         
         # Store session
-        sessions[session_id] = session
+        await session.save()
         
         return UploadResponse(
             session_id=session_id,
@@ -407,11 +762,10 @@ async def start_processing(session_id: str, background_tasks: BackgroundTasks):
     Start processing complaints for a session.
     Processing runs in the background - poll /progress/{session_id} for status.
     """
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if session.status == "processing":
         raise HTTPException(status_code=400, detail="Processing already in progress")
     
@@ -421,7 +775,8 @@ async def start_processing(session_id: str, background_tasks: BackgroundTasks):
     if not session.risk_table:
         raise HTTPException(status_code=400, detail="No risk table loaded")
     
-    # Start background processing
+    # Start background processing; this process owns the live object until it finishes
+    sessions[session_id] = session
     background_tasks.add_task(session.process_complaints)
     
     return {
@@ -434,23 +789,63 @@ async def start_processing(session_id: str, background_tasks: BackgroundTasks):
 @router.get("/progress/{session_id}", response_model=ProgressResponse)
 async def get_progress(session_id: str):
     """Get processing progress for a session"""
-    if session_id not in sessions:
+    progress = await get_session_progress(session_id)
+    if progress is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    progress = session.get_progress()
-    
     return ProgressResponse(**progress)
 
 
+async def _progress_events(session_id: str):
+    """Yield a server-sent event each time a session's progress changes, until it finishes"""
+    while True:
+        session = sessions.get(session_id)
+        if session is not None:
+            # Read before the snapshot, so a change made while the event is being sent still wakes the loop
+            seen_version = session._progress_version
+            progress = session.get_progress()
+        else:
+            progress = await get_session_progress(session_id)
+            if progress is None:
+                return
+        yield f"data: {orjson.dumps(progress).decode()}\n\n"
+        if progress["status"] in ("completed", "error"):
+            return
+        if session is not None:
+            # Running here: wake on the next update, with a periodic heartbeat
+            try:
+                async with session._progress_changed:
+                    await asyncio.wait_for(
+                        session._progress_changed.wait_for(lambda: session._progress_version != seen_version),
+                        PROGRESS_STREAM_HEARTBEAT
+                    )
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # Not running in this process (yet): follow the stored progress record
+            await asyncio.sleep(PROGRESS_STREAM_POLL_INTERVAL)
+
+
+@router.get("/progress-stream/{session_id}")
+async def stream_progress(session_id: str):
+    """Push processing progress for a session as server-sent events"""
+    if await get_session_progress(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return StreamingResponse(
+        _progress_events(session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/results/{session_id}")
 async def get_results(session_id: str):
     """Get processing results for a completed session"""
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if session.status != "completed":
         raise HTTPException(
             status_code=400, 
@@ -460,53 +855,59 @@ async def get_results(session_id: str):
     return {
         "session_id": session_id,
         "total_processed": len(session.results),
-        "results": session.results,
+        "results": [replace(r, priority_score=round(r.priority_score, 2)) for r in session.results],
         "processing_time_seconds": round((session.end_time - session.start_time).total_seconds(), 1)
     }
 
 
+# CSV column -> ResultRow attribute for downloads
+CSV_COLUMNS = {
+    "Complaint": "complaint",
+    "Risk Code": "risk_code",
+    "Risk Description": "risk_description",
+    "Impact Score": "impact_score",
+    "Urgency Score": "urgency_score",
+    "Frequency Score": "frequency_score",
+    "Controllability Score": "controllability_score",
+    "Priority Score": "priority_score",
+    "Priority Level": "priority_level"
+}
+_csv_fields = operator.attrgetter(*CSV_COLUMNS.values())
+_CSV_SCORE_INDEX = list(CSV_COLUMNS).index("Priority Score")
+
+
+async def _csv_stream(results: list):
+    """Yield the results CSV one row at a time, reusing a single small buffer"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for result in results:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        row = list(_csv_fields(result))
+        row[_CSV_SCORE_INDEX] = f"{row[_CSV_SCORE_INDEX]:.2f}"
+        writer.writerow(row)
+    yield buffer.getvalue()
+
+
 @router.get("/download/{session_id}")
 async def download_results(session_id: str):
     """Download processing results as CSV"""
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if session.status != "completed":
         raise HTTPException(
             status_code=400, 
             detail=f"Processing not complete. Current status: {session.status}"
         )
     
-    # Build CSV content
-    output = io.StringIO()
-    fieldnames = [
-        "Complaint", "Risk Code", "Risk Description", 
-        "Impact Score", "Urgency Score", "Frequency Score", "Controllability Score",
-        "Priority Score", "Priority Level"
-    ]
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    
-    for result in session.results:
-        writer.writerow({
-            "Complaint": result["complaint"],
-            "Risk Code": result["risk_code"],
-            "Risk Description": result["risk_description"],
-            "Impact Score": result["impact_score"],
-            "Urgency Score": result["urgency_score"],
-            "Frequency Score": result["frequency_score"],
-            "Controllability Score": result["controllability_score"],
-            "Priority Score": result["priority_score"],
-            "Priority Level": result["priority_level"]
-        })
-    
-    output.seek(0)
     filename = f"priority_classification_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     
     return StreamingResponse(
-        iter([output.getvalue()]),
+        _csv_stream(session.results),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -515,10 +916,9 @@ async def download_results(session_id: str):
 @router.delete("/session/{session_id}")
 async def delete_session(session_id: str):
     """Delete a session and its data"""
-    if session_id not in sessions:
+    if not await delete_stored_session(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    del sessions[session_id]
     return {"success": True, "message": "Session deleted"}
 
 
@@ -528,11 +928,10 @@ async def regenerate_results(session_id: str, request: RegenerateRequest, backgr
     Regenerate classification results based on user feedback.
     Reprocesses all complaints with feedback guidance.
     """
-    if session_id not in sessions:
+    session = await get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = sessions[session_id]
-    
     if not session.results:
         raise HTTPException(status_code=400, detail="No results to regenerate")
     
@@ -540,6 +939,7 @@ async def regenerate_results(session_id: str, request: RegenerateRequest, backgr
         raise HTTPException(status_code=400, detail="Please provide feedback")
     
     # Start background reprocessing
+    sessions[session_id] = session
     background_tasks.add_task(session.reprocess_with_feedback, request.feedback)
     
     return {
@@ -552,14 +952,30 @@ async def regenerate_results(session_id: str, request: RegenerateRequest, backgr
 @router.get("/cache/stats")
 async def get_cache_stats():
     """Get cache statistics"""
+    if redis_client is not None:
+        return {
+            "cached_classifications": await _count_keys("l2:cls:*"),
+            "active_sessions": await _count_keys("l2:session:*"),
+            **cache_counters
+        }
     return {
         "cached_classifications": len(classification_cache),
-        "active_sessions": len(sessions)
+        "max_cached_classifications": classification_cache.maxsize,
+        "active_sessions": len(sessions),
+        **cache_counters
     }
 
 
 @router.delete("/cache/clear")
 async def clear_cache():
     """Clear the classification cache"""
-    classification_cache.clear()
+    for session in sessions.values():
+        session._cache.clear()
+    if redis_client is not None:
+        keys = [key async for key in redis_client.scan_iter(match="l2:cls:*", count=1000)]
+        if keys:
+            await redis_client.delete(*keys)
+    else:
+        classification_cache.clear()
+    cache_counters.update(hits=0, misses=0)
     return {"success": True, "message": "Cache cleared"}
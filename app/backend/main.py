@@ -6,6 +6,7 @@ Each layer is implemented as a separate router module.
 """
 
 import os
+import asyncio
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -17,8 +18,8 @@ ROOT_DIR = Path(__file__).resolve().parent.parent.parent
 load_dotenv(ROOT_DIR / ".env")
 
 # Import routers from each layer
-from layer1.routes import router as layer1_router
-from layer2.routes import router as layer2_router
+from layer1.routes import router as layer1_router, expire_sessions
+from layer2.routes import router as layer2_router, reap_sessions
 
 # Create main FastAPI application
 app = FastAPI(
@@ -41,6 +42,22 @@ app.include_router(layer1_router, prefix="/api/layer1", tags=["Layer 1 - Risk Cl
 app.include_router(layer2_router, prefix="/api/layer2", tags=["Layer 2 - Future Development"])
 
 
+@app.on_event("startup")
+async def start_session_reapers():
+    """Evict expired Layer 1 and Layer 2 sessions in the background"""
+    app.state.session_reapers = [
+        asyncio.create_task(expire_sessions()),
+        asyncio.create_task(reap_sessions())
+    ]
+
+
+@app.on_event("shutdown")
+async def stop_session_reapers():
+    """Stop the session reapers"""
+    for task in app.state.session_reapers:
+        task.cancel()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""